@@ -6,13 +6,33 @@ from flask_login import LoginManager
 from flask_mail import Mail
 from flask_migrate import Migrate
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 
-from app.log import enable_logging_to_file, enable_logging_to_mail
+from app.activity import LastSeenRecorder
+from app.database import Database
+from app.explore import ExploreCache
+from app.follow_graph import FollowGraph
+from app.fragments import FragmentCache
+from app.identity import IdentityCache
+from app.language import LanguageDetector
+from app.log import enable_queued_logging, file_handler, mail_handler
+from app.outbox import MailOutbox
+from app.passwords import PasswordHasher
+from app.profiling import RequestProfiler
+from app.search import SearchIndex, include_object
+from app.translation_cache import TranslationCache
+from app.warmup import enable_bytecode_cache, warm_up
 from config import Config
 
-db = SQLAlchemy()
+db = Database()
 migrate = Migrate()
+follow_graph = FollowGraph(db)
+identity_cache = IdentityCache(db)
+last_seen_recorder = LastSeenRecorder(db)
+fragment_cache = FragmentCache()
+explore_cache = ExploreCache(db)
+translation_cache = TranslationCache()
+language_detector = LanguageDetector(db)
+search_index = SearchIndex(db)
 
 babel = Babel()
 bootstrap = Bootstrap()
@@ -21,6 +41,9 @@ login.login_view = "auth.login"
 login.login_message = _l("Please log in to access this page.")
 mail = Mail()
 moment = Moment()
+outbox = MailOutbox(db, mail)
+password_hasher = PasswordHasher()
+profiler = RequestProfiler()
 
 
 def create_app(config_class=Config):
@@ -28,26 +51,46 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
 
     db.init_app(app)
-    migrate.init_app(app, db)
+    migrate.init_app(app, db, include_object=include_object)
+    follow_graph.init_app(app)
+    identity_cache.init_app(app)
+    last_seen_recorder.init_app(app)
+    fragment_cache.init_app(app)
+    explore_cache.init_app(app)
+    translation_cache.init_app(app)
+    language_detector.init_app(app)
+    search_index.init_app(app)
 
     babel.init_app(app)
     bootstrap.init_app(app)
     login.init_app(app)
     mail.init_app(app)
     moment.init_app(app)
+    outbox.init_app(app)
+    password_hasher.init_app(app)
+    profiler.init_app(app)
 
+    from app.api import api_bp
     from app.auth import auth_bp
     from app.errors import errors_bp
     from app.core import core_bp
+    from app.health import health_bp
 
+    app.register_blueprint(api_bp, url_prefix="/api")
     app.register_blueprint(auth_bp, url_prefix="/auth")
     app.register_blueprint(errors_bp)
     app.register_blueprint(core_bp)
+    app.register_blueprint(health_bp)
+
+    enable_bytecode_cache(app)
+    if app.config["WARMUP"]:
+        warm_up(app)
 
     if not app.debug and not app.testing:
+        handlers = [file_handler(app)]
         if app.config["MAIL_SERVER"]:
-            enable_logging_to_mail(app)
-        enable_logging_to_file(app)
+            handlers.append(mail_handler(app))
+        enable_queued_logging(app, handlers)
 
     return app
 
@@ -0,0 +1,153 @@
+import atexit
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from typing import Optional
+
+from flask import Flask, current_app
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import bindparam
+
+
+class LastSeenRecorder:
+    """Write-behind buffer for `User.last_seen`.
+
+    Updates are coalesced in memory, throttled to one per user every
+    LAST_SEEN_THROTTLE seconds and written by a background flusher in a
+    single bulk UPDATE every LAST_SEEN_FLUSH_INTERVAL seconds. With
+    LAST_SEEN_EXACT set, every touch is committed right away instead.
+    Each application has its own buffer and flusher, bound to its database.
+    """
+
+    def __init__(self, db: SQLAlchemy, app: Optional[Flask] = None):
+        self.db = db
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["last_seen_recorder"] = self
+        app.extensions["last_seen_buffer"] = _Buffer(app)
+
+    def touch(self, user, when: Optional[datetime] = None) -> None:
+        """Record that `user` has just been active.
+
+        Args:
+            user (User): active user
+            when (Optional[datetime]): time of activity, defaults to now
+        """
+
+        when = when or datetime.utcnow()
+
+        if current_app.config["LAST_SEEN_EXACT"]:
+            user.last_seen = when
+            self.db.session.commit()
+            return
+
+        throttle = timedelta(seconds=current_app.config["LAST_SEEN_THROTTLE"])
+        buffer = current_app.extensions["last_seen_buffer"]
+
+        with buffer.lock:
+            recorded = buffer.recorded.get(user.id)
+            if recorded is not None and when - recorded < throttle:
+                return
+
+            buffer.recorded[user.id] = when
+            buffer.pending[user.id] = when
+
+        self._start_flusher(buffer)
+
+    def flush(self, app: Optional[Flask] = None) -> int:
+        """Write all pending updates in one bulk UPDATE.
+
+        Args:
+            app (Optional[Flask]): application, defaults to the current one
+
+        Returns:
+            int: number of users updated
+        """
+
+        app = app or current_app._get_current_object()
+        buffer = app.extensions["last_seen_buffer"]
+
+        with buffer.lock:
+            pending, buffer.pending = buffer.pending, {}
+
+            horizon = datetime.utcnow() - timedelta(
+                seconds=app.config["LAST_SEEN_THROTTLE"]
+            )
+            buffer.recorded = {
+                user_id: when
+                for user_id, when in buffer.recorded.items()
+                if when > horizon
+            }
+
+        if not pending:
+            return 0
+
+        user = self.db.metadata.tables["user"]
+        statement = (
+            user.update()
+            .where(user.c.id == bindparam("user_id"))
+            .values(last_seen=bindparam("when"))
+        )
+
+        try:
+            with self.db.get_engine(app).begin() as connection:
+                connection.execute(
+                    statement,
+                    [
+                        {"user_id": user_id, "when": when}
+                        for user_id, when in pending.items()
+                    ],
+                )
+        except Exception:
+            # keep updates for the next flush unless newer ones arrived
+            with buffer.lock:
+                for user_id, when in pending.items():
+                    buffer.pending.setdefault(user_id, when)
+            raise
+
+        return len(pending)
+
+    def _start_flusher(self, buffer: "_Buffer") -> None:
+        if buffer.flusher is not None:
+            return
+
+        with buffer.lock:
+            if buffer.flusher is not None:
+                return
+
+            buffer.flusher = Thread(
+                target=self._run, args=(buffer,), name="last-seen-flusher", daemon=True
+            )
+            buffer.flusher.start()
+
+        atexit.register(self._stop, buffer)
+
+    def _run(self, buffer: "_Buffer") -> None:
+        interval = buffer.app.config["LAST_SEEN_FLUSH_INTERVAL"]
+
+        while not buffer.wake.wait(interval):
+            self._safe_flush(buffer.app)
+
+    def _stop(self, buffer: "_Buffer") -> None:
+        buffer.wake.set()
+        self._safe_flush(buffer.app)
+
+    def _safe_flush(self, app: Flask) -> None:
+        try:
+            self.flush(app)
+        except Exception:
+            app.logger.exception("Could not flush last seen updates")
+
+
+class _Buffer:
+    """Pending updates of one application and the thread flushing them."""
+
+    def __init__(self, app: Flask):
+        self.app = app
+        self.pending = {}
+        self.recorded = {}
+        self.lock = Lock()
+        self.wake = Event()
+        self.flusher = None
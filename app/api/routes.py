@@ -0,0 +1,212 @@
+import json
+from functools import wraps
+from hashlib import sha1
+from typing import Optional
+
+from flask import current_app, jsonify, request
+from flask_login import current_user
+from sqlalchemy.orm import Bundle
+from werkzeug.exceptions import BadRequest
+
+from app.api import api_bp
+from app.database import replica_reads
+from app.models import Post, User
+from app.pagination import cursor_args, paginate
+
+
+def api_login_required(view):
+    """Like `login_required`, but answers 401 instead of redirecting."""
+
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return error_response(401, "authentication required")
+        return view(*args, **kwargs)
+
+    return wrapped
+
+
+def error_response(status: int, message: str):
+    return jsonify(error=message), status
+
+
+@api_bp.errorhandler(BadRequest)
+def bad_request(error: BadRequest):
+    return error_response(400, error.description)
+
+
+@api_bp.route("/feed/home")
+@replica_reads
+@api_login_required
+def home():
+    """Home feed of the current user.
+
+    Returns:
+        Response: JSON feed page or 304
+    """
+
+    query, key = current_user.home_timeline()
+    return feed_response(query, key, "home", current_user.id)
+
+
+@api_bp.route("/feed/explore")
+@replica_reads
+@api_login_required
+def explore():
+    """Feed of all posts.
+
+    Returns:
+        Response: JSON feed page or 304
+    """
+
+    return feed_response(Post.query, (Post.timestamp, Post.id), "explore")
+
+
+@api_bp.route("/users/<username>/posts")
+@replica_reads
+@api_login_required
+def user_posts(username: str):
+    """Feed of posts of a user.
+
+    Args:
+        username (str)
+
+    Returns:
+        Response: JSON feed page or 304
+    """
+
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        return error_response(404, "user not found")
+
+    return feed_response(user.posts, (Post.timestamp, Post.id), "user", user.id)
+
+
+@api_bp.route("/users/<username>")
+@replica_reads
+@api_login_required
+def user(username: str):
+    """Profile of a user.
+
+    Args:
+        username (str)
+
+    Returns:
+        Response: JSON profile or 304
+    """
+
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        return error_response(404, "user not found")
+
+    payload = {
+        "id": user.id,
+        "username": user.username,
+        "about_me": user.about_me,
+        "avatar": user.avatar(256),
+        "last_seen": _isoformat(user.last_seen),
+        "posts": user.posts_count,
+        "followers": user.followers_count,
+        "following": user.followed_count,
+    }
+
+    return conditional_response(
+        _etag(json.dumps(payload, sort_keys=True)), lambda: payload
+    )
+
+
+def feed_response(query, key, feed: str, owner_id: Optional[int] = None):
+    """Answer a feed request, or 304 if the client's copy is current.
+
+    The strong ETag is derived from the requested page as it would be
+    served: the id and language of each post, the profile version of its
+    author and the neighbouring cursors, read with one query on those
+    columns. Any new post, follow or unfollow that changes the page,
+    language detected later, or author rename changes the tag. Unchanged
+    feeds are answered before any post is loaded.
+
+    Args:
+        query: unordered feed query
+        key: `(timestamp, id)` pair of columns ordering the feed
+        feed (str): feed name
+        owner_id (Optional[int]): id of the user whose feed it is
+
+    Returns:
+        Response: JSON feed page or 304
+    """
+
+    pagination = cursor_args()
+    per_page = current_app.config["POSTS_PER_PAGE"]
+
+    shown = Bundle("shown", Post.id, Post.language, User.profile_version)
+    state = paginate(
+        query.join(Post.author).with_entities(shown), key, per_page, **pagination
+    )
+    etag = _etag(
+        feed,
+        owner_id,
+        [tuple(row) for row in state.items],
+        state.next_cursor,
+        state.prev_cursor,
+    )
+
+    def payload() -> dict:
+        page = paginate(query, key, per_page, **pagination)
+        Post.load_authors(page.items)
+
+        authors = {}
+        for post in page.items:
+            authors.setdefault(
+                str(post.author.id),
+                {"username": post.author.username, "avatar": post.author.avatar(70)},
+            )
+
+        return {
+            "posts": [
+                {
+                    "id": post.id,
+                    "author": post.user_id,
+                    "body": post.body,
+                    "language": post.language,
+                    "timestamp": _isoformat(post.timestamp),
+                }
+                for post in page.items
+            ],
+            "authors": authors,
+            "next": page.next_cursor,
+            "prev": page.prev_cursor,
+        }
+
+    return conditional_response(etag, payload)
+
+
+def conditional_response(etag: str, payload):
+    """Return 304 if the client has `etag`, else the JSON of `payload()`.
+
+    Args:
+        etag (str): strong entity tag of the response
+        payload: callable building the response data
+
+    Returns:
+        Response: response carrying the ETag
+    """
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(payload())
+
+    response.set_etag(etag)
+    # responses depend on the session, caches must revalidate every time
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+    return response
+
+
+def _etag(*parts) -> str:
+    return sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+def _isoformat(value) -> Optional[str]:
+    return value.isoformat() + "Z" if value is not None else None
@@ -3,7 +3,7 @@ from flask_babel import _
 from flask_login import current_user, login_user, logout_user
 from werkzeug.urls import url_parse
 
-from app import db
+from app import db, password_hasher
 from app.auth import auth_bp
 from app.auth.email import send_password_reset_email
 from app.auth.forms import (
@@ -28,6 +28,11 @@ def login():
             flash(_("Invalid username or password"))
             return redirect(url_for("auth.login"))
 
+        if password_hasher.needs_rehash(user.password_hash):
+            # the password is at hand only now, upgrade its hash to the policy
+            user.set_password(form.password.data)
+            db.session.commit()
+
         login_user(user, remember=form.remember_me.data)
 
         next = request.args.get("next")
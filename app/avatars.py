@@ -0,0 +1,72 @@
+import os
+import tempfile
+
+from flask import current_app
+
+GRID = 5
+
+
+def identicon(digest: str, size: int) -> str:
+    """Render a symmetric 5x5 identicon for an email digest as SVG.
+
+    Args:
+        digest (str): md5 hex digest of the email
+        size (int): width and height in pixels
+
+    Returns:
+        str: SVG document
+    """
+
+    hue = int(digest[-6:], 16) % 360
+    color = f"hsl({hue}, 55%, 50%)"
+
+    cells = []
+    for row in range(GRID):
+        for column in range((GRID + 1) // 2):
+            if int(digest[row * 3 + column], 16) % 2:
+                continue
+            cells.append((column, row))
+            if column != GRID - 1 - column:
+                cells.append((GRID - 1 - column, row))
+
+    rects = "".join(
+        f'<rect x="{column + 0.5}" y="{row + 0.5}" width="1" height="1"/>'
+        for column, row in cells
+    )
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {GRID + 1} {GRID + 1}" shape-rendering="crispEdges">'
+        f'<rect width="{GRID + 1}" height="{GRID + 1}" fill="#f0f0f0"/>'
+        f'<g fill="{color}">{rects}</g>'
+        "</svg>"
+    )
+
+
+def avatar_path(digest: str, size: int) -> str:
+    """Return the path of a cached identicon, generating it if needed.
+
+    Files are content-addressed by digest and size, so they never need to
+    be invalidated.
+
+    Args:
+        digest (str): md5 hex digest of the email
+        size (int): width and height in pixels
+
+    Returns:
+        str: absolute file path
+    """
+
+    directory = os.path.join(current_app.config["AVATAR_CACHE_DIR"], digest[:2])
+    path = os.path.join(directory, f"{digest}-{size}.svg")
+
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+
+        # write to a temporary file first so readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as tmp:
+            tmp.write(identicon(digest, size))
+        os.replace(tmp_path, path)
+
+    return path
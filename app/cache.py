@@ -0,0 +1,201 @@
+import time
+from collections import OrderedDict
+from threading import Event, Lock
+from typing import Any, Callable, Hashable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class LRUCache:
+    """Thread-safe least recently used cache.
+
+    The cache is bounded by the total weight of its values. By default each
+    value weighs 1, so `capacity` is the number of entries.
+    """
+
+    def __init__(
+        self, capacity: int = 1024, weigh: Optional[Callable[[Any], int]] = None
+    ):
+        self.capacity = capacity
+        self.weigh = weigh or (lambda value: 1)
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        weight = self.weigh(value)
+
+        with self._lock:
+            self._discard(key)
+
+            if weight > self.capacity:
+                return
+
+            self._data[key] = (value, weight)
+            self.weight += weight
+
+            while self.weight > self.capacity:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.weight -= evicted
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+            self.hits = 0
+            self.misses = 0
+
+    def _discard(self, key: Hashable) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.weight -= item[1]
+
+
+class TTLCache:
+    """Thread-safe cache of values expiring `ttl` seconds after they are set.
+
+    Concurrent misses on a key are coalesced: the first caller computes the
+    value while the others wait for it and reuse the result. Values computed
+    across a `clear()` or a `pop()` of their key are not stored, so
+    invalidation is never undone by a computation that started before it.
+    """
+
+    def __init__(self, ttl: float, capacity: int = 1024):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+
+        self._data = OrderedDict()
+        self._flights = {}
+        self._generation = 0
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value of `key`, computing it on a miss.
+
+        Args:
+            key (Hashable): cache key
+            compute (Callable[[], Any]): function computing the value
+
+        Returns:
+            Any: cached or computed value
+        """
+
+        while True:
+            with self._lock:
+                item = self._data.get(key)
+                if item is not None and item[1] > time.monotonic():
+                    self.hits += 1
+                    return item[0]
+
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    self.misses += 1
+                    flight = self._flights[key] = _Flight(self._generation)
+
+            if leader:
+                return self._compute(key, flight, compute)
+
+            flight.done.wait()
+            if flight.succeeded:
+                return flight.value
+            # the computing caller failed, try again
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+            flight = self._flights.pop(key, None)
+            if flight is not None:
+                # the value being computed may predate the change
+                flight.generation = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._flights = {}
+            self._generation += 1
+
+    def _compute(self, key: Hashable, flight, compute: Callable[[], Any]) -> Any:
+        try:
+            flight.value = compute()
+            flight.succeeded = True
+        finally:
+            with self._lock:
+                if flight.succeeded and flight.generation == self._generation:
+                    self._data.pop(key, None)
+                    self._data[key] = (flight.value, time.monotonic() + self.ttl)
+                    while len(self._data) > self.capacity:
+                        self._data.popitem(last=False)
+
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+            flight.done.set()
+
+        return flight.value
+
+
+class _Flight:
+    """A computation of a `TTLCache` value that other callers can wait for."""
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.done = Event()
+        self.succeeded = False
+        self.value = None
+
+
+def on_transaction_end(session: Session, callback: Callable[[], None]) -> None:
+    """Run `callback` once the current transaction of `session` ends.
+
+    Used to invalidate caches after a commit or rollback, so that no other
+    thread can repopulate them with data that is about to change.
+
+    Args:
+        session (Session): database session
+        callback (Callable[[], None]): function to call
+    """
+
+    session.info.setdefault("on_transaction_end", []).append(callback)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _run_transaction_end_callbacks(session, transaction) -> None:
+    if transaction.parent is not None:
+        return
+
+    for callback in session.info.pop("on_transaction_end", ()):
+        callback()
@@ -1,7 +1,25 @@
+import json
 import os
+import time
+from datetime import datetime, timedelta
 
 import click
 
+from app import db, language_detector, search_index
+from app.database import analyze, checkpoint, vacuum
+from app.data import (
+    TABLES,
+    deferred_indexes,
+    export_records,
+    import_records,
+    read_records,
+    rebuild_derived_data,
+)
+from app.models import Post, User
+from app.server import PreforkServer
+from app.translate import pretranslate as pretranslate_posts
+from app.warmup import warm_up
+
 
 def register(app):
     @app.cli.group()
@@ -53,3 +71,285 @@ def register(app):
             raise RuntimeError("init command failed")
 
         os.remove("messages.pot")
+
+    @translate.command()
+    @click.option("--days", default=7, help="Only posts from the last DAYS days.")
+    @click.option("--limit", default=500, help="Maximum number of posts.")
+    def pretranslate(days: int, limit: int) -> None:
+        """Translate popular recent posts into all supported languages.
+
+        Posts are ranked by their author's follower count, as the best
+        available proxy for how often they are viewed.
+
+        Args:
+            days (int): age limit of posts in days
+            limit (int): maximum number of posts
+
+        Raises:
+            RuntimeError: if Yandex Translate is not set up
+        """
+
+        if not app.config["YANDEX_TRANSLATE_TOKEN"]:
+            raise RuntimeError("YANDEX_TRANSLATE_TOKEN is not set up")
+        if not app.config["YANDEX_TRANSLATE_FOLDER_ID"]:
+            raise RuntimeError("YANDEX_TRANSLATE_FOLDER_ID is not set up")
+
+        posts = (
+            Post.query.join(User, User.id == Post.user_id)
+            .filter(Post.timestamp >= datetime.utcnow() - timedelta(days=days))
+            .filter(Post.language.isnot(None), Post.language != "")
+            .order_by(User.followers_count.desc(), Post.timestamp.desc())
+            .limit(limit)
+        )
+
+        count = pretranslate_posts(posts, app.config["LANGUAGES"])
+        click.echo(f"{count} translations added.")
+
+    @app.cli.group()
+    def language():
+        """Post language detection commands."""
+
+    @language.command()
+    @click.option("--batch-size", default=500, help="Posts per batch.")
+    def detect(batch_size: int) -> None:
+        """Detect languages of all posts whose language is still pending.
+
+        Args:
+            batch_size (int): posts per batch
+        """
+
+        total = 0
+        for count in language_detector.detect_pending(batch_size):
+            total += count
+            click.echo(f"{total} posts processed.")
+
+    @app.cli.command()
+    @click.option("--host", default="127.0.0.1", help="Interface to listen on.")
+    @click.option("--port", default=8000, help="Port to listen on.")
+    @click.option(
+        "--workers",
+        type=int,
+        default=lambda: app.config["SERVER_WORKERS"],
+        help="Worker processes, by default two per CPU core plus one.",
+    )
+    @click.option(
+        "--max-requests",
+        type=click.IntRange(min=0),
+        default=lambda: app.config["SERVER_MAX_REQUESTS"],
+        help="Requests served by a worker before it is replaced, 0 for never.",
+    )
+    def serve(host: str, port: int, workers: int, max_requests: int) -> None:
+        """Run the pre-forking production server.
+
+        Send SIGHUP to the server process to reload the code without
+        downtime, and SIGTERM to stop it gracefully.
+
+        Args:
+            host (str): interface to listen on
+            port (int): port to listen on
+            workers (int): worker processes, 0 for two per CPU core plus one
+            max_requests (int): requests served by a worker before it is
+                replaced
+        """
+
+        PreforkServer(
+            app,
+            host,
+            port,
+            workers,
+            max_requests,
+            app.config["SERVER_MAX_REQUESTS_JITTER"],
+            app.config["SERVER_GRACEFUL_TIMEOUT"],
+        ).run()
+
+    @app.cli.command()
+    def warmup() -> None:
+        """Preload lazily initialized data and fill the template bytecode cache.
+
+        Run at deploy time, so that restarted servers find compiled templates.
+        """
+
+        for step, seconds in warm_up(app).items():
+            click.echo(f"{step} loaded in {seconds * 1000:.1f} ms.")
+
+    @app.cli.command("db-maint")
+    @click.option(
+        "--analyze/--no-analyze", "analyze_", default=True, help="Refresh statistics."
+    )
+    @click.option(
+        "--vacuum-pages",
+        type=int,
+        default=0,
+        help="Most free pages to release by incremental vacuum, 0 for all.",
+    )
+    @click.option(
+        "--full-vacuum",
+        is_flag=True,
+        help="Rebuild the whole file, enabling incremental vacuum. Locks it.",
+    )
+    @click.option(
+        "--checkpoint/--no-checkpoint",
+        "checkpoint_",
+        default=True,
+        help="Checkpoint and truncate the write-ahead log.",
+    )
+    def db_maint(
+        analyze_: bool, vacuum_pages: int, full_vacuum: bool, checkpoint_: bool
+    ) -> None:
+        """Run routine maintenance of a SQLite database.
+
+        Args:
+            analyze_ (bool): refresh the query planner statistics
+            vacuum_pages (int): most free pages to release, 0 for all
+            full_vacuum (bool): rebuild the whole database file
+            checkpoint_ (bool): checkpoint and truncate the write-ahead log
+
+        Raises:
+            click.UsageError: if the database is not SQLite
+        """
+
+        engine = db.engine
+        if engine.dialect.name != "sqlite":
+            raise click.UsageError("Maintenance is only needed for SQLite databases.")
+
+        if analyze_:
+            analyze(engine)
+            click.echo("Statistics refreshed.")
+
+        freed = vacuum(engine, vacuum_pages, full_vacuum)
+        click.echo(f"{freed} pages released.")
+
+        if checkpoint_:
+            logged, copied = checkpoint(engine)
+            click.echo(f"{copied} of {logged} log pages checkpointed.")
+
+    @app.cli.group()
+    def counters():
+        """Denormalized counters maintenance commands."""
+
+    @counters.command()
+    def rebuild() -> None:
+        """Recompute follower, following and post counters of all users."""
+
+        User.rebuild_counters()
+        db.session.commit()
+
+        click.echo("Counters rebuilt.")
+
+    @app.cli.group()
+    def search():
+        """Full-text search index commands."""
+
+    @search.command("rebuild")
+    @click.option("--batch-size", default=5000, help="Posts per transaction.")
+    def rebuild_search(batch_size: int) -> None:
+        """Rebuild the search index of all posts.
+
+        Args:
+            batch_size (int): posts per transaction
+        """
+
+        for total in search_index.rebuild(batch_size):
+            click.echo(f"{total} posts indexed.")
+
+    @app.cli.group()
+    def data():
+        """Bulk data import and export commands."""
+
+    @data.command("import")
+    @click.argument("kind", type=click.Choice(list(TABLES)))
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--batch-size", default=5000, help="Records per transaction.")
+    @click.option(
+        "--checkpoint",
+        type=click.Path(dir_okay=False),
+        help="Checkpoint file, defaults to PATH.checkpoint.",
+    )
+    @click.option(
+        "--defer-indexes", is_flag=True, help="Build secondary indexes after the load."
+    )
+    @click.option(
+        "--rebuild/--no-rebuild",
+        default=True,
+        help="Recompute counters, timelines and the search index afterwards.",
+    )
+    def import_(
+        kind: str,
+        path: str,
+        batch_size: int,
+        checkpoint: str,
+        defer_indexes: bool,
+        rebuild: bool,
+    ) -> None:
+        """Stream users, posts or follow edges from a JSONL or CSV file.
+
+        An interrupted import resumes from its checkpoint when run again.
+        Posts without a language are left for `flask language detect`.
+
+        Args:
+            kind (str): `users`, `posts` or `follows`
+            path (str): `.jsonl` or `.csv` file, optionally gzip'd
+            batch_size (int): records per transaction
+            checkpoint (str): checkpoint file path
+            defer_indexes (bool): drop secondary indexes during the load
+            rebuild (bool): recompute counters, timelines and the search
+                index afterwards
+        """
+
+        checkpoint = checkpoint or f"{path}.checkpoint"
+        table = db.metadata.tables[TABLES[kind]]
+        started = time.monotonic()
+
+        def load() -> None:
+            for total in import_records(kind, read_records(path), batch_size, checkpoint):
+                rate = total / max(time.monotonic() - started, 1e-6)
+                click.echo(f"{total} {kind} imported ({rate:.0f}/s).")
+
+        if defer_indexes:
+            with deferred_indexes(table):
+                load()
+        else:
+            load()
+
+        if rebuild:
+            rebuild_derived_data(batch_size)
+            click.echo("Counters, timelines and search index rebuilt.")
+
+    @data.command()
+    @click.argument("kind", type=click.Choice(list(TABLES)))
+    @click.argument("path", type=click.Path(dir_okay=False))
+    @click.option("--batch-size", default=5000, help="Rows fetched at a time.")
+    @click.option(
+        "--watermark",
+        type=click.Path(dir_okay=False),
+        help="Export only rows newer than this watermark file, then advance it.",
+    )
+    def export(kind: str, path: str, batch_size: int, watermark: str) -> None:
+        """Stream users, posts or follow edges into a JSONL or CSV file.
+
+        Use a `.gz` suffix for gzip'd output. Incremental exports track the
+        last exported user id and post timestamp and id; follow edges are
+        always exported in full.
+
+        Args:
+            kind (str): `users`, `posts` or `follows`
+            path (str): `.jsonl` or `.csv` file, optionally gzip'd
+            batch_size (int): rows fetched at a time
+            watermark (str): watermark file path
+        """
+
+        previous = None
+        if watermark and os.path.exists(watermark):
+            with open(watermark) as source:
+                previous = json.load(source)
+
+        total, current = 0, previous
+        for total, current in export_records(kind, path, batch_size, previous):
+            click.echo(f"{total} {kind} exported.")
+
+        if watermark and current is not None:
+            with open(f"{watermark}.tmp", "w") as target:
+                json.dump(current, target)
+            os.replace(f"{watermark}.tmp", watermark)
+
+        click.echo(f"Export of {total} {kind} finished.")
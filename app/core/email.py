@@ -1,28 +1,19 @@
-from threading import Thread
+from typing import List
 
-from flask import current_app
-from flask_babel import _
-from flask_mail import Message
-
-from app import mail
-
-
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+from app import outbox
 
 
 def send_email(
     subject: str,
     sender: str,
-    recipients: str,
+    recipients: List[str],
     text_body: str,
     html_body: str,
 ) -> None:
-    msg = Message(subject, sender=sender, recipients=recipients)
-    msg.body = text_body
-    msg.html = html_body
+    """Queue an email in the durable outbox.
+
+    The message is committed to the database and sent by the outbox
+    workers, so it is not lost if the process restarts.
+    """
 
-    Thread(
-        target=send_async_email, args=(current_app._get_current_object(), msg)
-    ).start()
+    outbox.enqueue(subject, sender, recipients, text_body, html_body)
@@ -1,3 +1,4 @@
+from flask import request
 from flask_babel import _
 from flask_babel import lazy_gettext as _l
 from flask_wtf import FlaskForm
@@ -32,3 +33,13 @@ class PostForm(FlaskForm):
         _l("Say something"), validators=[DataRequired(), Length(min=1, max=140)]
     )
     submit = SubmitField(_l("Submit"))
+
+
+class SearchForm(FlaskForm):
+    q = StringField(_l("Search"), validators=[DataRequired()])
+
+    def __init__(self, *args, **kwargs):
+        # searches are plain GET requests
+        kwargs.setdefault("formdata", request.args)
+        kwargs.setdefault("meta", {"csrf": False})
+        super(SearchForm, self).__init__(*args, **kwargs)
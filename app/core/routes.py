@@ -1,6 +1,7 @@
-from datetime import datetime
+import re
 
 from flask import (
+    abort,
     current_app,
     flash,
     g,
@@ -8,30 +9,41 @@ from flask import (
     redirect,
     render_template,
     request,
+    send_file,
     url_for,
 )
 from flask_babel import _, get_locale
 from flask_login import current_user, login_required
-from langdetect import LangDetectException, detect
 
-from app import db
+from app import (
+    db,
+    explore_cache,
+    fragment_cache,
+    language_detector,
+    last_seen_recorder,
+    search_index,
+)
+from app.avatars import avatar_path
+from app.database import replica_reads
 from app.core import core_bp
-from app.core.forms import EditProfileForm, EmptyForm, PostForm
+from app.core.forms import EditProfileForm, EmptyForm, PostForm, SearchForm
 from app.models import Post, User
+from app.pagination import Page, cursor_args, paginate
 from app.translate import translate
 
 
 @core_bp.before_app_request
 def before_request():
     if current_user.is_authenticated:
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
+        last_seen_recorder.touch(current_user)
+        g.search_form = SearchForm()
 
     g.locale = str(get_locale())
 
 
 @core_bp.route("/", methods=["GET", "POST"])
 @core_bp.route("/index", methods=["GET", "POST"])
+@replica_reads
 @login_required
 def index() -> str:
     """Route for displaying index page and sending posts.
@@ -46,57 +58,95 @@ def index() -> str:
     form = PostForm()
 
     if form.validate_on_submit():
-        try:
-            language = detect(form.post.data)
-        except LangDetectException:
-            language = ""
-
-        post = Post(body=form.post.data, author=current_user, language=language)
+        # language stays pending until the detector gets to the post
+        post = Post(body=form.post.data, author=current_user)
 
         db.session.add(post)
         db.session.commit()
 
+        language_detector.submit(post.id)
+
         flash(_("Your post is now live!"))
         return redirect(url_for("core.index"))
 
-    page = request.args.get("page", default=1, type=int)
-
-    posts = current_user.followed_posts().paginate(
-        page, current_app.config["POSTS_PER_PAGE"], False
+    query, key = current_user.home_timeline()
+    posts = paginate(
+        query, key, current_app.config["POSTS_PER_PAGE"], **cursor_args()
     )
+    Post.load_authors(posts.items)
 
     return render_template(
         "index.html",
         title=_("Home"),
         form=form,
-        posts=posts.items,
-        next_url=url_for("core.index", page=posts.next_num) if posts.has_next else None,
-        prev_url=url_for("core.index", page=posts.prev_num) if posts.has_prev else None,
+        fragments=fragment_cache.render_posts(posts.items),
+        next_url=posts.next_url("core.index"),
+        prev_url=posts.prev_url("core.index"),
     )
 
 
 @core_bp.route("/explore")
+@replica_reads
 @login_required
 def explore():
-    page = request.args.get("page", default=1, type=int)
-    posts = Post.query.order_by(Post.timestamp.desc()).paginate(
-        page, current_app.config["POSTS_PER_PAGE"], False
-    )
+    def render_page() -> Page:
+        posts = paginate(
+            Post.query,
+            (Post.timestamp, Post.id),
+            current_app.config["POSTS_PER_PAGE"],
+            **cursor_args()
+        )
+        Post.load_authors(posts.items)
+
+        return Page(
+            fragment_cache.render_posts(posts.items),
+            next_cursor=posts.next_cursor,
+            prev_cursor=posts.prev_cursor,
+        )
+
+    # pages hold rendered fragments only, they are the same for all users
+    page = explore_cache.get_page(g.locale, render_page)
 
     return render_template(
         "index.html",
         title=_("Explore"),
-        posts=posts.items,
-        next_url=url_for("core.explore", page=posts.next_num)
-        if posts.has_next
-        else None,
-        prev_url=url_for("core.explore", page=posts.prev_num)
-        if posts.has_prev
-        else None,
+        fragments=page.items,
+        next_url=page.next_url("core.explore"),
+        prev_url=page.prev_url("core.explore"),
+    )
+
+
+@core_bp.route("/search")
+@replica_reads
+@login_required
+def search():
+    """Route for full-text search over posts.
+
+    Results are ranked by relevance and recency and paginated by score.
+
+    Returns:
+        str: HTML template
+    """
+
+    if not g.search_form.validate():
+        return redirect(url_for("core.explore"))
+
+    text = g.search_form.q.data
+    query, key = search_index.search(text)
+    posts = paginate(query, key, current_app.config["POSTS_PER_PAGE"], **cursor_args())
+    Post.load_authors(posts.items)
+
+    return render_template(
+        "search.html",
+        title=_("Search"),
+        fragments=fragment_cache.render_posts(posts.items),
+        next_url=posts.next_url("core.search", q=text),
+        prev_url=posts.prev_url("core.search", q=text),
     )
 
 
 @core_bp.route("/user/<username>")
+@replica_reads
 @login_required
 def user(username: str) -> str:
     """Route for displaying user profile.
@@ -108,33 +158,24 @@ def user(username: str) -> str:
         str: HTML template
     """
 
-    page = request.args.get("page", default=1, type=int)
-
     user = User.query.filter_by(username=username).first_or_404()
-    posts = user.posts.order_by(Post.timestamp.desc()).paginate(
-        page, current_app.config["POSTS_PER_PAGE"], False
+    posts = paginate(
+        user.posts,
+        (Post.timestamp, Post.id),
+        current_app.config["POSTS_PER_PAGE"],
+        **cursor_args()
     )
+    Post.load_authors(posts.items)
 
     form = EmptyForm()
 
-    next_url = (
-        url_for("core.user", username=user.username, page=posts.next_num)
-        if posts.has_next
-        else None
-    )
-    prev_url = (
-        url_for("core.user", username=user.username, page=posts.prev_num)
-        if posts.has_prev
-        else None
-    )
-
     return render_template(
         "user.html",
         form=form,
-        posts=posts.items,
+        fragments=fragment_cache.render_posts(posts.items),
         user=user,
-        next_url=next_url,
-        prev_url=prev_url,
+        next_url=posts.next_url("core.user", username=user.username),
+        prev_url=posts.prev_url("core.user", username=user.username),
     )
 
 
@@ -144,6 +185,10 @@ def edit_profile():
     form = EditProfileForm(current_user.username)
 
     if form.validate_on_submit():
+        if form.username.data != current_user.username:
+            current_user.profile_version = User.profile_version + 1
+            explore_cache.invalidate(db.session())
+
         current_user.username = form.username.data
         current_user.about_me = form.about_me.data
 
@@ -220,3 +265,34 @@ def translate_text():
             )
         }
     )
+
+
+@core_bp.route("/avatar/<digest>/<int:size>")
+def avatar(digest: str, size: int):
+    """Route for serving locally generated identicons.
+
+    Args:
+        digest (str): md5 hex digest of the user's email
+        size (int): width and height in pixels
+
+    Returns:
+        Response: SVG image, cacheable forever
+    """
+
+    if not re.fullmatch("[0-9a-f]{32}", digest):
+        abort(404)
+    if size not in current_app.config["AVATAR_SIZES"]:
+        abort(404)
+    # only cache identicons of real accounts, or anyone could fill the disk
+    if User.query.filter_by(email_hash=digest).first() is None:
+        abort(404)
+
+    response = send_file(
+        avatar_path(digest, size),
+        mimetype="image/svg+xml",
+        max_age=current_app.config["AVATAR_MAX_AGE"],
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+
+    return response
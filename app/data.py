@@ -0,0 +1,294 @@
+import csv
+import gzip
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from hashlib import md5
+from itertools import islice
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from sqlalchemy import Table, and_, or_, select
+
+from app import db, search_index
+from app.models import User
+
+# import and export kinds, the tables they map to and their columns
+TABLES = {"users": "user", "posts": "post", "follows": "followers"}
+COLUMNS = {
+    "users": ["id", "username", "email", "password_hash", "about_me", "last_seen"],
+    "posts": ["id", "body", "timestamp", "user_id", "language"],
+    "follows": ["follower_id", "followed_id"],
+}
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    """Stream records from a JSONL or CSV file, optionally gzip'd.
+
+    The format is taken from the file extension: `.jsonl` or `.csv`,
+    followed by `.gz` for compressed files.
+
+    Args:
+        path (str): file path
+
+    Yields:
+        Dict: one record per line or CSV row
+
+    Raises:
+        ValueError: if the format is not supported
+    """
+
+    with _open(path, "rt") as source:
+        if _format(path) == "jsonl":
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(source)
+
+
+def export_records(
+    kind: str, path: str, batch_size: int, watermark: Optional[Dict] = None
+) -> Iterator[Tuple[int, Optional[Dict]]]:
+    """Stream a table into a JSONL or CSV file, optionally gzip'd.
+
+    Rows are fetched through a server-side cursor `batch_size` at a time, so
+    memory use does not depend on the table size. With a watermark, only
+    users and posts newer than it are exported; follow edges carry no
+    timestamp and are always exported in full.
+
+    Args:
+        kind (str): `users`, `posts` or `follows`
+        path (str): file path, its extension selects the format
+        batch_size (int): rows fetched at a time
+        watermark (Optional[Dict]): watermark of the previous export
+
+    Yields:
+        Tuple[int, Optional[Dict]]: total number of exported rows and the
+            watermark after each batch
+    """
+
+    table = db.metadata.tables[TABLES[kind]]
+    columns = COLUMNS[kind]
+    watermark = dict(watermark or {})
+    query = select(*(table.c[column] for column in columns))
+
+    if kind == "users":
+        query = query.order_by(table.c.id)
+        if "users" in watermark:
+            query = query.where(table.c.id > watermark["users"])
+    elif kind == "posts":
+        query = query.order_by(table.c.timestamp, table.c.id)
+        if "posts" in watermark:
+            timestamp, post_id = watermark["posts"]
+            timestamp = datetime.fromisoformat(timestamp)
+            query = query.where(
+                or_(
+                    table.c.timestamp > timestamp,
+                    and_(table.c.timestamp == timestamp, table.c.id > post_id),
+                )
+            )
+
+    total = 0
+
+    with _open(path, "wt") as target, db.engine.connect() as connection:
+        writer = None
+        if _format(path) == "csv":
+            writer = csv.DictWriter(target, columns)
+            writer.writeheader()
+
+        result = connection.execution_options(
+            stream_results=True, yield_per=batch_size
+        ).execute(query)
+
+        for rows in result.mappings().partitions():
+            for row in rows:
+                record = {
+                    key: value.isoformat() if isinstance(value, datetime) else value
+                    for key, value in row.items()
+                }
+                if writer is None:
+                    target.write(json.dumps(record, ensure_ascii=False) + "\n")
+                else:
+                    writer.writerow(record)
+
+            total += len(rows)
+            last = rows[-1]
+            if kind == "users":
+                watermark["users"] = last["id"]
+            elif kind == "posts":
+                watermark["posts"] = [last["timestamp"].isoformat(), last["id"]]
+            yield total, watermark
+
+
+def import_records(
+    kind: str,
+    records: Iterable[Dict],
+    batch_size: int,
+    checkpoint: Optional[str] = None,
+) -> Iterator[int]:
+    """Insert records in batches, one transaction per batch.
+
+    Each batch is a single executemany INSERT. When a checkpoint file is
+    given, the number of committed records is saved there after every batch
+    and records already imported by an interrupted run are skipped.
+
+    Posts and follow edges bypass the ORM, so counters, timelines and the
+    search index have to be rebuilt afterwards, see `rebuild_derived_data`.
+
+    Args:
+        kind (str): `users`, `posts` or `follows`
+        records (Iterable[Dict]): records to import
+        batch_size (int): records per batch and transaction
+        checkpoint (Optional[str]): checkpoint file path
+
+    Yields:
+        int: total number of imported records after each batch
+    """
+
+    table = db.metadata.tables[TABLES[kind]]
+    convert = {"users": _user_row, "posts": _post_row, "follows": _follow_row}[kind]
+
+    done = _read_checkpoint(checkpoint, kind)
+    records = iter(records)
+    for _skipped in islice(records, done):
+        pass
+
+    while True:
+        batch = [convert(record) for record in islice(records, batch_size)]
+        if not batch:
+            break
+        if "id" in batch[0] and all(row["id"] is None for row in batch):
+            # let the database assign ids
+            batch = [
+                {key: value for key, value in row.items() if key != "id"}
+                for row in batch
+            ]
+
+        with db.engine.begin() as connection:
+            connection.execute(table.insert(), batch)
+
+        done += len(batch)
+        if checkpoint is not None:
+            _write_checkpoint(checkpoint, kind, done)
+        yield done
+
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+
+@contextmanager
+def deferred_indexes(table: Table):
+    """Drop non-unique indexes of `table` and recreate them on exit.
+
+    Loading into a table without secondary indexes and building them once
+    at the end is much faster than maintaining them row by row. Unique
+    indexes are kept, they enforce integrity during the load.
+
+    Args:
+        table (Table): table being loaded
+    """
+
+    indexes = [index for index in table.indexes if not index.unique]
+
+    for index in indexes:
+        index.drop(db.engine, checkfirst=True)
+    try:
+        yield
+    finally:
+        for index in indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+def rebuild_derived_data(batch_size: int = 5000) -> None:
+    """Recompute counters, timelines and the search index after a bulk load.
+
+    Args:
+        batch_size (int): posts indexed per transaction
+    """
+
+    User.rebuild_counters()
+    User.rebuild_timelines()
+    db.session.commit()
+
+    for _total in search_index.rebuild(batch_size):
+        pass
+
+
+def _format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(".jsonl"):
+        return "jsonl"
+    if name.endswith(".csv"):
+        return "csv"
+
+    raise ValueError(f"Unsupported file format: {path}")
+
+
+def _open(path: str, mode: str):
+    _format(path)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8", newline="")
+
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def _user_row(record: Dict) -> Dict:
+    email = record.get("email") or None
+
+    return {
+        "id": _int(record.get("id")),
+        "username": record["username"],
+        "email": email,
+        "email_hash": md5(email.lower().encode()).hexdigest() if email else None,
+        "password_hash": record.get("password_hash") or None,
+        "about_me": record.get("about_me") or None,
+        "last_seen": _datetime(record.get("last_seen")) or datetime.utcnow(),
+    }
+
+
+def _post_row(record: Dict) -> Dict:
+    return {
+        "id": _int(record.get("id")),
+        "body": record["body"],
+        "timestamp": _datetime(record.get("timestamp")) or datetime.utcnow(),
+        "user_id": int(record["user_id"]),
+        # NULL marks the language as pending detection
+        "language": record.get("language") or None,
+    }
+
+
+def _follow_row(record: Dict) -> Dict:
+    return {
+        "follower_id": int(record["follower_id"]),
+        "followed_id": int(record["followed_id"]),
+    }
+
+
+def _int(value) -> Optional[int]:
+    return int(value) if value not in (None, "") else None
+
+
+def _datetime(value) -> Optional[datetime]:
+    if value in (None, ""):
+        return None
+    return datetime.fromisoformat(value.rstrip("Z"))
+
+
+def _read_checkpoint(path: Optional[str], kind: str) -> int:
+    if path is None or not os.path.exists(path):
+        return 0
+
+    with open(path) as source:
+        state = json.load(source)
+    if state["kind"] != kind:
+        raise ValueError(f"Checkpoint {path} belongs to a {state['kind']} import")
+
+    return state["records"]
+
+
+def _write_checkpoint(path: str, kind: str, records: int) -> None:
+    # write and rename, so a crash never leaves a truncated checkpoint
+    with open(f"{path}.tmp", "w") as target:
+        json.dump({"kind": kind, "records": records}, target)
+    os.replace(f"{path}.tmp", path)
@@ -0,0 +1,272 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from flask import Flask, current_app, g, has_request_context, request, request_started
+from flask import session as cookie_session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, orm, text
+from sqlalchemy.pool import NullPool, QueuePool
+
+REPLICA = "replica"
+SAFE_METHODS = ("GET", "HEAD")
+
+
+def replica_reads(view: Callable) -> Callable:
+    """Mark a view whose GET requests may read from the replica database."""
+
+    view.replica_reads = True
+    return view
+
+
+class RoutingSession(SignallingSession):
+    """Session sending the reads of marked GET requests to the replica.
+
+    Everything else goes to the primary: writes, reads outside of requests
+    and reads following a write of the same request, which could miss the
+    write on a lagging replica.
+    """
+
+    def __init__(self, db: "Database", **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or getattr(clause, "is_dml", False):
+            self.db.record_write()
+        elif getattr(clause, "is_select", False) and self.db.reads_from_replica():
+            self.db.record_route(REPLICA)
+            return self.db.get_engine(self.app, bind=REPLICA)
+
+        self.db.record_route("primary")
+        return super().get_bind(mapper, clause)
+
+
+class Database(SQLAlchemy):
+    """Flask-SQLAlchemy tuned for SQLite files shared by several workers.
+
+    Every new SQLite connection runs the SQLITE_PRAGMAS statements. WAL
+    journaling lets readers go on while a writer commits and `busy_timeout`
+    makes writers wait for each other instead of failing with "database is
+    locked". File databases keep a pool of SQLITE_POOL_SIZE connections
+    rather than opening one per checkout, so the page cache and memory map
+    of a connection outlive a request.
+
+    With a `replica` entry in SQLALCHEMY_BINDS, views marked with
+    `replica_reads` read from it on GET requests until they write. A client
+    that wrote keeps reading from the primary for DATABASE_REPLICA_LAG
+    seconds, so it sees its own changes after a redirect. Shared caches
+    fill themselves within `primary_reads`, since what they keep is served
+    to clients that must see their own writes, and per-process caches can
+    stretch that window with `remember_write` and skip themselves while
+    `recently_wrote`. Each request records the databases it used in its
+    profile under `db`.
+    """
+
+    def init_app(self, app: Flask) -> None:
+        super().init_app(app)
+
+        request_started.connect(self._start_request, app)
+        app.after_request(self._remember_write)
+
+    def create_session(self, options: dict):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def reads_from_replica(self) -> bool:
+        """Tell whether reads of the current request may go to the replica."""
+
+        if not has_request_context() or request.method not in SAFE_METHODS:
+            return False
+        if not _has_replica():
+            return False
+        if g.get("_db_primary_reads") or self.recently_wrote():
+            return False
+
+        view = current_app.view_functions.get(request.endpoint)
+        return getattr(view, "replica_reads", False)
+
+    @contextmanager
+    def primary_reads(self) -> Iterator[None]:
+        """Send the reads made within the block to the primary."""
+
+        if not has_request_context():
+            yield
+            return
+
+        outer = g.get("_db_primary_reads", False)
+        g._db_primary_reads = True
+        try:
+            yield
+        finally:
+            g._db_primary_reads = outer
+
+    def recently_wrote(self) -> bool:
+        """Tell whether the client of the current request wrote lately.
+
+        Returns:
+            bool: True if this request or one of the client's requests
+                within the window set by `remember_write` wrote
+        """
+
+        if not has_request_context():
+            return False
+
+        return (
+            g.get("_db_wrote", False)
+            or cookie_session.get("_primary_until", 0) > time.time()
+        )
+
+    def remember_write(self, seconds: float) -> None:
+        """Make `recently_wrote` hold for the client for `seconds` if the
+        current request wrote.
+
+        Args:
+            seconds (float): how long the client counts as having written
+        """
+
+        if not g.get("_db_wrote") or seconds <= 0:
+            return
+
+        until = time.time() + seconds
+        if cookie_session.get("_primary_until", 0) < until:
+            cookie_session["_primary_until"] = until
+
+    def record_write(self) -> None:
+        """Keep the rest of the current request on the primary."""
+
+        if has_request_context():
+            g._db_wrote = True
+
+    def record_route(self, bind: str) -> None:
+        """Note the database a statement of the current request went to."""
+
+        if not has_request_context() or not _has_replica():
+            return
+
+        routes = g.setdefault("_db_routes", [])
+        if bind not in routes:
+            routes.append(bind)
+            profiler = current_app.extensions.get("profiler")
+            if profiler is not None:
+                profiler.annotate("db", "+".join(routes))
+
+    def _start_request(self, app: Flask, **extra) -> None:
+        # `g` outlives the request when an app context was already pushed
+        g._db_wrote = False
+        g._db_routes = []
+
+    def _remember_write(self, response):
+        if _has_replica():
+            self.remember_write(current_app.config["DATABASE_REPLICA_LAG"])
+
+        return response
+
+    def apply_driver_hacks(self, app, sa_url, options: dict) -> Tuple:
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+
+        if options.get("poolclass") is NullPool and app.config["SQLITE_POOL_SIZE"]:
+            options["poolclass"] = QueuePool
+            options["pool_size"] = app.config["SQLITE_POOL_SIZE"]
+            options["max_overflow"] = app.config["SQLITE_POOL_MAX_OVERFLOW"]
+            options["pool_timeout"] = app.config["SQLITE_POOL_TIMEOUT"]
+            # pooled connections are handed from thread to thread
+            options.setdefault("connect_args", {})["check_same_thread"] = False
+
+        return sa_url, options
+
+    def create_engine(self, sa_url, engine_opts: dict):
+        engine = super().create_engine(sa_url, engine_opts)
+
+        pragmas = self.get_app().config["SQLITE_PRAGMAS"]
+        if engine.dialect.name == "sqlite" and pragmas:
+            event.listen(engine, "connect", _pragma_setter(pragmas))
+
+        return engine
+
+
+def _has_replica() -> bool:
+    return REPLICA in (current_app.config["SQLALCHEMY_BINDS"] or ())
+
+
+def _pragma_setter(pragmas: Dict[str, object]):
+    def set_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+    return set_pragmas
+
+
+def analyze(engine) -> None:
+    """Refresh the statistics the SQLite query planner chooses indexes by.
+
+    Args:
+        engine: SQLite engine
+    """
+
+    with engine.connect() as connection:
+        connection.execute(text("PRAGMA analysis_limit = 1000"))
+        connection.execute(text("ANALYZE"))
+
+
+def vacuum(engine, pages: Optional[int] = None, full: bool = False) -> int:
+    """Return free pages of the SQLite database to the file system.
+
+    Incremental vacuuming needs `auto_vacuum = INCREMENTAL`, which only
+    databases created with it have. A full vacuum rebuilds the whole file,
+    switching it to the mode of the connection, and locks it meanwhile.
+
+    Args:
+        engine: SQLite engine
+        pages (Optional[int]): most pages to free, all if not given
+        full (bool): rebuild the whole database file
+
+    Returns:
+        int: number of pages freed
+    """
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        before = connection.execute(text("PRAGMA page_count")).scalar()
+
+        if full:
+            connection.execute(text("VACUUM"))
+        elif connection.execute(text("PRAGMA auto_vacuum")).scalar() == 2:
+            free = connection.execute(text("PRAGMA freelist_count")).scalar()
+            if pages:
+                free = min(free, int(pages))
+
+            # every step of incremental_vacuum frees one page, but the driver
+            # only steps statements without result columns once, so run one
+            # statement per page, all within a single transaction
+            connection.execute(text("BEGIN IMMEDIATE"))
+            try:
+                for _ in range(free):
+                    connection.execute(text("PRAGMA incremental_vacuum(1)"))
+            except BaseException:
+                connection.execute(text("ROLLBACK"))
+                raise
+            connection.execute(text("COMMIT"))
+
+        return before - connection.execute(text("PRAGMA page_count")).scalar()
+
+
+def checkpoint(engine) -> Tuple[int, int]:
+    """Copy the write-ahead log into the database file and truncate it.
+
+    Args:
+        engine: SQLite engine
+
+    Returns:
+        Tuple[int, int]: pages in the log and pages checkpointed, both -1
+            when the database is not in WAL mode
+    """
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        _, logged, copied = connection.execute(
+            text("PRAGMA wal_checkpoint(TRUNCATE)")
+        ).one()
+
+    return logged, copied
@@ -0,0 +1,109 @@
+from typing import Callable, Optional
+
+from flask import Flask, request
+from flask_sqlalchemy import SQLAlchemy
+
+from app.cache import TTLCache, on_transaction_end
+from app.pagination import Page
+
+
+class ExploreCache:
+    """Shared cache of the first EXPLORE_CACHE_PAGES pages of the explore feed.
+
+    The explore feed is the same for every user, so its pages, made of
+    rendered post fragments, are cached per locale for EXPLORE_CACHE_TTL
+    seconds and dropped whenever a post is created. Concurrent misses on a
+    page are computed once.
+
+    Cursor pages have no number, so the depth of a page is learned from the
+    cursors of the cached pages leading to it. Pages reached otherwise, or
+    deeper than the limit, are not cached. Cached pages are rendered from
+    the primary database, as they are served to every client.
+    """
+
+    def __init__(self, db: SQLAlchemy, app: Optional[Flask] = None):
+        self.db = db
+        self.pages = 0
+        self._cache = TTLCache(0)
+        self._depths = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.pages = app.config["EXPLORE_CACHE_PAGES"]
+        self._cache = TTLCache(app.config["EXPLORE_CACHE_TTL"])
+        self._depths = {}
+
+        app.extensions["explore_cache"] = self
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def get_page(self, locale: str, compute: Callable[[], Page]) -> Page:
+        """Return the explore page requested by the current request.
+
+        Args:
+            locale (str): locale the page is rendered in
+            compute (Callable[[], Page]): function rendering the page
+
+        Returns:
+            Page: page of rendered post fragments
+        """
+
+        depth = self._depth()
+        if depth is None or depth >= self.pages:
+            return compute()
+
+        key = (
+            locale,
+            request.args.get("after"),
+            request.args.get("before"),
+            request.args.get("page"),
+        )
+
+        def compute_and_track() -> Page:
+            with self.db.primary_reads():
+                page = compute()
+            if page.next_cursor is not None:
+                self._depths[("after", page.next_cursor)] = depth + 1
+            if page.prev_cursor is not None:
+                self._depths[("before", page.prev_cursor)] = depth - 1
+            return page
+
+        return self._cache.get_or_compute(key, compute_and_track)
+
+    def invalidate(self, session=None) -> None:
+        """Drop all cached pages, now and when the transaction of `session`
+        ends.
+
+        Args:
+            session: database session writing the change, if any
+        """
+
+        self._clear()
+        if session is not None:
+            on_transaction_end(session, self._clear)
+
+    def _clear(self) -> None:
+        self._cache.clear()
+        self._depths = {}
+
+    def _depth(self) -> Optional[int]:
+        after = request.args.get("after")
+        before = request.args.get("before")
+        page = request.args.get("page", type=int)
+
+        if after is not None:
+            return self._depths.get(("after", after))
+        if before is not None:
+            return self._depths.get(("before", before))
+        if page is not None:
+            return page - 1 if page > 0 else None
+
+        return 0
@@ -0,0 +1,89 @@
+from typing import Optional
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from app.cache import TTLCache, on_transaction_end
+
+
+class FollowGraph:
+    """In-process cache of the follow graph.
+
+    Keeps the set of followed user ids per user, up to FOLLOW_GRAPH_CACHE_SIZE
+    of them, and the set of accounts on the timeline pull path, so membership
+    checks and feed filters do not go to the database once the cache is warm.
+
+    Changes made by this process are invalidated right away, changes made by
+    other processes are seen once entries expire after FOLLOW_GRAPH_CACHE_TTL
+    seconds. Writes must therefore not be decided from the cache. Entries
+    are read from the primary database, never from a replica.
+    """
+
+    def __init__(self, db: SQLAlchemy, app: Optional[Flask] = None):
+        self.db = db
+        self._cache = TTLCache(0)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self._cache = TTLCache(
+            app.config["FOLLOW_GRAPH_CACHE_TTL"],
+            app.config["FOLLOW_GRAPH_CACHE_SIZE"] + 1,
+        )
+
+        app.extensions["follow_graph"] = self
+
+    def followed_ids(self, user_id: int) -> frozenset:
+        """Return ids of users followed by `user_id`.
+
+        Args:
+            user_id (int): follower id
+
+        Returns:
+            frozenset: followed user ids
+        """
+
+        def load() -> frozenset:
+            followers = self.db.metadata.tables["followers"]
+            with self.db.primary_reads():
+                rows = self.db.session.query(followers.c.followed_id).filter(
+                    followers.c.follower_id == user_id
+                )
+                return frozenset(row.followed_id for row in rows)
+
+        return self._cache.get_or_compute(("followed", user_id), load)
+
+    def pull_ids(self) -> frozenset:
+        """Return ids of accounts on the timeline pull path.
+
+        Returns:
+            frozenset: user ids
+        """
+
+        def load() -> frozenset:
+            user = self.db.metadata.tables["user"]
+            with self.db.primary_reads():
+                rows = self.db.session.query(user.c.id).filter(user.c.timeline_pull)
+                return frozenset(row.id for row in rows)
+
+        return self._cache.get_or_compute("pull", load)
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget followed ids of `user_id`, now and when the transaction ends.
+
+        Args:
+            user_id (int): follower id
+        """
+
+        self._pop(("followed", user_id))
+
+    def invalidate_pull_ids(self) -> None:
+        """Forget the set of pull path accounts, now and when the transaction
+        ends."""
+
+        self._pop("pull")
+
+    def _pop(self, key) -> None:
+        self._cache.pop(key)
+        on_transaction_end(self.db.session(), lambda: self._cache.pop(key))
@@ -0,0 +1,76 @@
+from typing import Optional
+
+from flask import Flask, g, render_template
+from markupsafe import Markup
+
+from app.cache import LRUCache
+
+
+class FragmentCache:
+    """LRU cache of rendered `_post.html` fragments.
+
+    Fragments are keyed by post id, post language, the request locale and
+    the author's profile version, so they go stale only when one of those
+    changes. The cache is bounded by FRAGMENT_CACHE_MAX_BYTES of HTML.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self._cache = LRUCache()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self._cache = LRUCache(
+            app.config["FRAGMENT_CACHE_MAX_BYTES"],
+            weigh=lambda html: len(html.encode()),
+        )
+
+        app.extensions["fragment_cache"] = self
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._cache),
+            "bytes": self._cache.weight,
+        }
+
+    def render_post(self, post) -> Markup:
+        """Return the rendered fragment of a post.
+
+        Args:
+            post (Post): post with its author loaded
+
+        Returns:
+            Markup: HTML fragment
+        """
+
+        key = (post.id, post.language, g.locale, post.author.profile_version)
+
+        html = self._cache.get(key)
+        if html is None:
+            html = Markup(render_template("_post.html", post=post))
+            self._cache.set(key, html)
+
+        return html
+
+    def render_posts(self, posts: list) -> list:
+        """Return rendered fragments of a page of posts.
+
+        Args:
+            posts (list): posts with their authors loaded
+
+        Returns:
+            list: HTML fragments in the same order
+        """
+
+        return [self.render_post(post) for post in posts]
@@ -0,0 +1,45 @@
+from flask import current_app, jsonify
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.health import health_bp
+
+
+@health_bp.route("/healthz")
+def liveness():
+    """Tell that the process serves requests, without touching anything else.
+
+    Returns:
+        Response: plain text `ok`
+    """
+
+    return "ok", 200, {"Content-Type": "text/plain", "Cache-Control": "no-store"}
+
+
+@health_bp.route("/readyz")
+def readiness():
+    """Tell whether the process can serve real traffic.
+
+    The database is ready if the primary answers a trivial query. Warm-up
+    is reported for information only, an unwarmed process is slow but works.
+
+    Returns:
+        Response: JSON status, with 503 if the database is unreachable
+    """
+
+    try:
+        with db.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        database = "ok"
+    except SQLAlchemyError:
+        current_app.logger.warning("Readiness check failed", exc_info=True)
+        database = "unavailable"
+
+    response = jsonify(
+        database=database, warmed_up="warmup" in current_app.extensions
+    )
+    response.status_code = 200 if database == "ok" else 503
+    response.headers["Cache-Control"] = "no-store"
+
+    return response
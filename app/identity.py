@@ -0,0 +1,134 @@
+from itertools import chain
+from types import MappingProxyType
+from typing import Optional
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from app.cache import TTLCache, on_transaction_end
+
+
+class IdentityCache:
+    """In-process cache of immutable snapshots of rows loaded by primary key.
+
+    Snapshots hold the column values of a row and live for at most
+    IDENTITY_CACHE_TTL seconds, with up to IDENTITY_CACHE_SIZE of them kept.
+    A hit is turned back into a session-bound object without any query.
+    Objects changed through the ORM session are invalidated on flush and
+    again when the transaction ends; changes made with bulk statements need
+    an explicit `invalidate`. Other processes see changes once the TTL ends,
+    so a client that wrote loads rows straight from the primary database for
+    IDENTITY_CACHE_TTL seconds. Snapshots are read from the primary database,
+    never from a replica.
+    """
+
+    def __init__(self, db: SQLAlchemy, app: Optional[Flask] = None):
+        self.db = db
+        self._cache = TTLCache(0)
+        self._models = set()
+
+        event.listen(Session, "after_flush", self._after_flush)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self._cache = TTLCache(
+            app.config["IDENTITY_CACHE_TTL"], app.config["IDENTITY_CACHE_SIZE"]
+        )
+
+        app.extensions["identity_cache"] = self
+        app.after_request(self._remember_write)
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def load(self, model, ident: int):
+        """Return the object of `model` with primary key `ident`.
+
+        Args:
+            model: mapped class
+            ident (int): primary key
+
+        Returns:
+            object of `model` attached to the session, or None if no such row
+        """
+
+        self._models.add(model)
+        session = self.db.session()
+
+        key = identity_key(model, ident)
+        instance = session.identity_map.get(key)
+        if instance is not None:
+            return instance
+
+        # another process may still hold a snapshot from before the write
+        if self.db.recently_wrote():
+            with self.db.primary_reads():
+                return session.get(model, ident)
+
+        loaded = []
+
+        def snapshot():
+            with self.db.primary_reads():
+                instance = session.get(model, ident)
+            loaded.append(instance)
+            if instance is None:
+                return None
+            return MappingProxyType(
+                {
+                    attribute.key: getattr(instance, attribute.key)
+                    for attribute in inspect(model).column_attrs
+                }
+            )
+
+        values = self._cache.get_or_compute(key, snapshot)
+        if loaded:
+            return loaded[0]
+        if values is None:
+            return None
+
+        instance = inspect(model).class_manager.new_instance()
+        for name, value in values.items():
+            set_committed_value(instance, name, value)
+        make_transient_to_detached(instance)
+        session.add(instance)
+
+        return instance
+
+    def invalidate(self, model, ident: int) -> None:
+        """Drop the snapshot of a row, now and when the transaction ends.
+
+        Args:
+            model: mapped class
+            ident (int): primary key
+        """
+
+        key = identity_key(model, ident)
+        self._cache.pop(key)
+        on_transaction_end(self.db.session(), lambda: self._cache.pop(key))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def _remember_write(self, response):
+        self.db.remember_write(self._cache.ttl)
+
+        return response
+
+    def _after_flush(self, session, flush_context) -> None:
+        for instance in chain(session.dirty, session.deleted):
+            if type(instance) in self._models:
+                key = inspect(instance).key
+                if key is not None:
+                    self._cache.pop(key)
+                    on_transaction_end(session, lambda key=key: self._cache.pop(key))
@@ -0,0 +1,223 @@
+from collections import Counter, defaultdict
+from queue import Empty, Queue
+from threading import Lock, Thread
+from typing import Dict, List, Optional
+
+from flask import Flask, current_app
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import bindparam, func, select
+
+
+class LanguageDetector:
+    """Detects languages of new posts off the request path.
+
+    Posts are stored with `language` set to NULL, which marks detection as
+    pending. Their ids are queued and a pool of worker threads detects them
+    in batches, writing results back with one bulk UPDATE per batch. With
+    LANGUAGE_DETECTION_SYNC set, detection runs right away in the caller.
+    Each application has its own queue and workers, bound to its database.
+
+    The queue lives in memory and is lost when the process exits, so idle
+    workers also pick up pending posts from the database every
+    LANGUAGE_DETECTION_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, db: SQLAlchemy, app: Optional[Flask] = None):
+        self.db = db
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["language_detector"] = self
+        app.extensions["language_detection_queue"] = _Workers(app)
+
+        if not app.config["LANGUAGE_DETECTION_SYNC"]:
+            # pick up posts left over by a previous process
+            app.before_request(
+                lambda: self._start_workers(app.extensions["language_detection_queue"])
+            )
+
+    def submit(self, post_id: int) -> None:
+        """Schedule language detection of a committed post.
+
+        Args:
+            post_id (int): post id
+        """
+
+        if current_app.config["LANGUAGE_DETECTION_SYNC"]:
+            self.detect_batch([post_id])
+            return
+
+        workers = current_app.extensions["language_detection_queue"]
+        self._start_workers(workers)
+        workers.queue.put(post_id)
+
+    def detect_batch(self, post_ids: List[int], app: Optional[Flask] = None) -> int:
+        """Detect and store languages of pending posts.
+
+        Short posts take the dominant language of their author's earlier
+        posts when there is one. Posts whose language cannot be detected
+        get an empty language, so they are not picked up again.
+
+        Args:
+            post_ids (List[int]): post ids
+            app (Optional[Flask]): application, defaults to the current one
+
+        Returns:
+            int: number of posts updated
+        """
+
+        app = app or current_app._get_current_object()
+        post = self.db.metadata.tables["post"]
+
+        with self.db.get_engine(app).begin() as connection:
+            rows = connection.execute(
+                select(post.c.id, post.c.body, post.c.user_id)
+                .where(post.c.id.in_(post_ids))
+                .where(post.c.language.is_(None))
+            ).all()
+
+            if not rows:
+                return 0
+
+            history = self._dominant_languages(
+                connection, {row.user_id for row in rows}, app
+            )
+            short_post = app.config["LANGUAGE_DETECTION_SHORT_POST"]
+
+            updates = []
+            for row in rows:
+                language = None
+                if len(row.body or "") < short_post:
+                    language = history.get(row.user_id)
+                if language is None:
+                    language = _detect(row.body or "")
+
+                updates.append({"post_id": row.id, "language": language})
+
+            connection.execute(
+                post.update()
+                .where(post.c.id == bindparam("post_id"))
+                .values(language=bindparam("language")),
+                updates,
+            )
+
+        return len(updates)
+
+    def detect_pending(self, batch_size: int, app: Optional[Flask] = None):
+        """Detect languages of all pending posts, batch by batch.
+
+        Args:
+            batch_size (int): posts per batch
+            app (Optional[Flask]): application, defaults to the current one
+
+        Yields:
+            int: number of posts updated by each batch
+        """
+
+        app = app or current_app._get_current_object()
+        post = self.db.metadata.tables["post"]
+
+        while True:
+            with self.db.get_engine(app).connect() as connection:
+                post_ids = connection.execute(
+                    select(post.c.id)
+                    .where(post.c.language.is_(None))
+                    .order_by(post.c.id)
+                    .limit(batch_size)
+                ).scalars().all()
+
+            if not post_ids:
+                return
+
+            yield self.detect_batch(post_ids, app)
+
+    def _dominant_languages(self, connection, user_ids: set, app: Flask) -> Dict:
+        """Return the language most of each author's posts are written in."""
+
+        post = self.db.metadata.tables["post"]
+        rows = connection.execute(
+            select(post.c.user_id, post.c.language, func.count())
+            .where(post.c.user_id.in_(user_ids))
+            .where(post.c.language.isnot(None))
+            .where(post.c.language != "")
+            .group_by(post.c.user_id, post.c.language)
+        )
+
+        counts = defaultdict(Counter)
+        for user_id, language, count in rows:
+            counts[user_id][language] = count
+
+        share = app.config["LANGUAGE_DETECTION_HISTORY_SHARE"]
+        dominant = {}
+        for user_id, languages in counts.items():
+            language, count = languages.most_common(1)[0]
+            if count >= share * sum(languages.values()):
+                dominant[user_id] = language
+
+        return dominant
+
+    def _start_workers(self, workers: "_Workers") -> None:
+        if workers.threads:
+            return
+
+        with workers.lock:
+            if workers.threads:
+                return
+
+            for number in range(workers.app.config["LANGUAGE_DETECTION_WORKERS"]):
+                thread = Thread(
+                    target=self._run,
+                    args=(workers,),
+                    name=f"language-detector-{number}",
+                    daemon=True,
+                )
+                thread.start()
+                workers.threads.append(thread)
+
+    def _run(self, workers: "_Workers") -> None:
+        app = workers.app
+        batch_size = app.config["LANGUAGE_DETECTION_BATCH_SIZE"]
+        interval = app.config["LANGUAGE_DETECTION_POLL_INTERVAL"]
+
+        while True:
+            try:
+                batch = [workers.queue.get(timeout=interval)]
+            except Empty:
+                batch = None
+            else:
+                try:
+                    while len(batch) < batch_size:
+                        batch.append(workers.queue.get_nowait())
+                except Empty:
+                    pass
+
+            try:
+                if batch is None:
+                    for _ in self.detect_pending(batch_size, app):
+                        pass
+                else:
+                    self.detect_batch(batch, app)
+            except Exception:
+                app.logger.exception("Could not detect post languages")
+
+
+class _Workers:
+    """Posts queued for detection in one application and their workers."""
+
+    def __init__(self, app: Flask):
+        self.app = app
+        self.queue = Queue()
+        self.threads = []
+        self.lock = Lock()
+
+
+def _detect(text: str) -> str:
+    # langdetect loads all its language profiles on first use
+    from langdetect import LangDetectException, detect
+
+    try:
+        return detect(text)
+    except LangDetectException:
+        return ""
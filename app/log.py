@@ -1,15 +1,155 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler, SMTPHandler
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import (
+    MemoryHandler,
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    SMTPHandler,
+)
+from queue import Empty, Queue
+from threading import Lock
+from typing import List
 
 from flask import Flask
 
 
-def enable_logging_to_mail(app: Flask) -> None:
-    """Enable logging in email messages.
+class JSONFormatter(logging.Formatter):
+    """Format log records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.utcfromtimestamp(record.created).isoformat() + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+        }
+        if hasattr(record, "data"):
+            entry["data"] = record.data
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class MailRateLimitFilter(logging.Filter):
+    """Drop repeated and excess records before they are emailed.
+
+    A record coming from the same place as one sent less than
+    `dedup_window` seconds ago is dropped, and at most `max_per_hour`
+    records pass in any hour.
+    """
+
+    def __init__(self, dedup_window: float, max_per_hour: int):
+        super().__init__()
+        self.dedup_window = dedup_window
+        self.max_per_hour = max_per_hour
+
+        self._last_sent = {}
+        self._sent = deque()
+        self._lock = Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # the call site, not the message, which may embed ids or other data
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+
+        with self._lock:
+            # entries are kept in the order they were sent, oldest first
+            while self._last_sent:
+                oldest = next(iter(self._last_sent))
+                if now - self._last_sent[oldest] < self.dedup_window:
+                    break
+                del self._last_sent[oldest]
+
+            last_sent = self._last_sent.get(key)
+            if last_sent is not None and now - last_sent < self.dedup_window:
+                return False
+
+            while self._sent and now - self._sent[0] >= 3600:
+                self._sent.popleft()
+            if len(self._sent) >= self.max_per_hour:
+                return False
+
+            self._last_sent.pop(key, None)
+            self._last_sent[key] = now
+            self._sent.append(now)
+
+        return True
+
+
+class TimedMemoryHandler(MemoryHandler):
+    """Buffer records and flush them when the buffer is full, on errors, or
+    when the oldest buffered record is older than `flush_interval` seconds.
+
+    Age is checked as records arrive and by `flush_if_due`, which
+    `FlushingQueueListener` calls while no records arrive.
+    """
+
+    def __init__(self, capacity: int, flush_interval: float, **kwargs):
+        super().__init__(capacity, **kwargs)
+        self.flush_interval = flush_interval
+        self._buffered_since = time.monotonic()
+
+    def shouldFlush(self, record: logging.LogRecord) -> bool:
+        if len(self.buffer) == 1:
+            self._buffered_since = time.monotonic()
+
+        return super().shouldFlush(record) or self._due()
+
+    def flush_if_due(self) -> None:
+        """Flush the buffer if its oldest record is too old."""
+
+        if self._due():
+            self.flush()
+
+    def _due(self) -> bool:
+        return (
+            bool(self.buffer)
+            and time.monotonic() - self._buffered_since >= self.flush_interval
+        )
+
+
+class FlushingQueueListener(QueueListener):
+    """Queue listener flushing the buffers of its `TimedMemoryHandler`
+    handlers when the queue stays empty, so that records of a quiet app
+    are still written within about `flush_interval` seconds.
+    """
+
+    def __init__(self, queue: Queue, *handlers, respect_handler_level=False):
+        super().__init__(queue, *handlers, respect_handler_level=respect_handler_level)
+        self._timed = [
+            handler for handler in handlers if isinstance(handler, TimedMemoryHandler)
+        ]
+        self._timeout = min(
+            (handler.flush_interval for handler in self._timed), default=None
+        )
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        while True:
+            try:
+                return self.queue.get(block, self._timeout)
+            except Empty:
+                # runs in the listener thread, like every other handler call
+                for handler in self._timed:
+                    handler.flush_if_due()
+
+
+def mail_handler(app: Flask) -> logging.Handler:
+    """Create a rate-limited handler sending errors in email messages.
 
     Args:
         app (Flask): application object
+
+    Returns:
+        logging.Handler: log handler
     """
 
     auth = None
@@ -20,7 +160,7 @@ def enable_logging_to_mail(app: Flask) -> None:
     if app.config["MAIL_USE_TLS"]:
         secure = ()
 
-    mail_handler = SMTPHandler(
+    handler = SMTPHandler(
         mailhost=(app.config["MAIL_SERVER"], app.config["MAIL_PORT"]),
         fromaddr=f"no-reply@{app.config['MAIL_SERVER']}",
         toaddrs=app.config["ADMINS"],
@@ -28,24 +168,110 @@ def enable_logging_to_mail(app: Flask) -> None:
         credentials=auth,
         secure=secure,
     )
-    mail_handler.setLevel(logging.ERROR)
+    handler.setLevel(logging.ERROR)
+    handler.addFilter(
+        MailRateLimitFilter(
+            app.config["LOG_MAIL_DEDUP_WINDOW"], app.config["LOG_MAIL_MAX_PER_HOUR"]
+        )
+    )
 
-    app.logger.addHandler(mail_handler)
+    return handler
 
 
-def enable_logging_to_file(app: Flask) -> None:
-    """Enable logging in log file.
+def file_handler(app: Flask) -> logging.Handler:
+    """Create a buffered handler writing JSON lines to a rotating log file.
 
     Args:
         app (Flask): application object
+
+    Returns:
+        logging.Handler: log handler
     """
 
     if not os.path.exists("logs"):
         os.mkdir("logs")
 
-    file_handler = RotatingFileHandler(
-        "logs/microblog.log", maxBytes=10240, backupCount=10
+    target = RotatingFileHandler(
+        "logs/microblog.log",
+        maxBytes=app.config["LOG_FILE_MAX_BYTES"],
+        backupCount=app.config["LOG_FILE_BACKUP_COUNT"],
+    )
+    target.setFormatter(JSONFormatter())
+
+    handler = TimedMemoryHandler(
+        app.config["LOG_FILE_BUFFER_RECORDS"],
+        app.config["LOG_FILE_FLUSH_INTERVAL"],
+        flushLevel=logging.ERROR,
+        target=target,
     )
-    file_handler.setLevel(logging.INFO)
+    handler.setLevel(logging.INFO)
+
+    return handler
+
+
+def enable_queued_logging(app: Flask, handlers: List[logging.Handler]) -> None:
+    """Route application logs to `handlers` through a background thread.
+
+    Request threads only put records on a queue; a `FlushingQueueListener`
+    thread formats them and does all file and network I/O.
+
+    Args:
+        app (Flask): application object
+        handlers (List[logging.Handler]): handlers to run in the listener
+    """
+
+    queue = Queue(-1)
+
+    listener = FlushingQueueListener(queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app.logger.addHandler(QueueHandler(queue))
+    app.logger.setLevel(logging.INFO)
+    app.extensions["log_listener"] = listener
+
+
+def restart_queued_logging(app: Flask) -> None:
+    """Start a new listener thread in a process forked from one logging
+    through `enable_queued_logging`, where the thread does not survive.
+
+    Records buffered by the parent process are dropped, the parent writes
+    them.
+
+    Args:
+        app (Flask): application object
+    """
+
+    listener = app.extensions.get("log_listener")
+    if listener is None:
+        return
+
+    listener.queue = Queue(-1)
+    for handler in app.logger.handlers:
+        if isinstance(handler, QueueHandler):
+            handler.queue = listener.queue
+    for handler in listener.handlers:
+        if isinstance(handler, MemoryHandler):
+            handler.buffer = []
+
+    listener._thread = None
+    listener.start()
+
+
+def stop_queued_logging(app: Flask) -> None:
+    """Write out all queued and buffered records and stop the listener.
+
+    For processes leaving through `os._exit` or `os.execv`, which skip the
+    exit handlers doing this otherwise.
+
+    Args:
+        app (Flask): application object
+    """
+
+    listener = app.extensions.get("log_listener")
+    if listener is None or listener._thread is None:
+        return
 
-    app.logger.addHandler(file_handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.flush()
@@ -3,16 +3,49 @@ from hashlib import md5
 from time import time
 
 import jwt
-from flask import current_app
+from flask import current_app, url_for
 from flask_login import UserMixin
-from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy import DDL, event, func, literal, or_, select, update
+from sqlalchemy.orm import validates
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 
-from app import db, login
+from app import (
+    db,
+    explore_cache,
+    follow_graph,
+    identity_cache,
+    login,
+    password_hasher,
+    search_index,
+)
+from app.search import FTS_CREATE, FTS_DROP
 
 followers = db.Table(
     "followers",
-    db.Column("follower_id", db.Integer, db.ForeignKey("user.id")),
-    db.Column("followed_id", db.Integer, db.ForeignKey("user.id")),
+    db.Column("follower_id", db.Integer, db.ForeignKey("user.id"), primary_key=True),
+    db.Column("followed_id", db.Integer, db.ForeignKey("user.id"), primary_key=True),
+    db.Index("ix_followers_followed_id", "followed_id", "follower_id"),
+)
+
+# Materialized home timelines: one row per (reader, post) pair. Rows are
+# written when a post is created (fan-out on write) and when the follow graph
+# changes, so reading a home feed is a range scan over a single index.
+timeline = db.Table(
+    "timeline",
+    db.Column("user_id", db.Integer, db.ForeignKey("user.id"), primary_key=True),
+    db.Column("post_id", db.Integer, db.ForeignKey("post.id"), primary_key=True),
+    db.Column("timestamp", db.DateTime, nullable=False),
+    db.Index("ix_timeline_user_id_timestamp", "user_id", "timestamp", "post_id"),
+)
+
+# Inverted index of post bodies, used for search on databases other than
+# SQLite, which has FTS5 instead. See app/search.py.
+search_terms = db.Table(
+    "search_term",
+    db.Column("term", db.String(64), primary_key=True),
+    db.Column("post_id", db.Integer, db.ForeignKey("post.id"), primary_key=True),
+    db.Column("frequency", db.Integer, nullable=False),
 )
 
 
@@ -22,9 +55,23 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True)
     email = db.Column(db.String(64), index=True, unique=True)
+    email_hash = db.Column(db.String(32), index=True)
     password_hash = db.Column(db.String(128))
     about_me = db.Column(db.String(140))
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    # Accounts with more followers than TIMELINE_FANOUT_LIMIT are not fanned
+    # out on write; their followers pull those posts when reading the feed.
+    timeline_pull = db.Column(
+        db.Boolean, nullable=False, default=False, server_default=db.false()
+    )
+    # Denormalized counters, kept in step by follow(), unfollow() and post
+    # creation. `flask counters rebuild` recomputes them from scratch.
+    followers_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    followed_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    posts_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Bumped whenever data shown next to the user's posts changes, it keys
+    # the cache of rendered post fragments.
+    profile_version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
 
     posts = db.relationship("Post", backref="author", lazy="dynamic")
     followed = db.relationship(
@@ -40,10 +87,10 @@ class User(UserMixin, db.Model):
         return f"<User {self.username}>"
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
 
     def get_reset_password_token(self, expires_in: int = 600) -> str:
         return jwt.encode(
@@ -67,39 +114,204 @@ class User(UserMixin, db.Model):
         except Exception:
             return
 
+    @validates("email")
+    def update_email_hash(self, key, email):
+        """Keep the avatar digest in step with the email."""
+
+        self.email_hash = md5(email.lower().encode()).hexdigest() if email else None
+        return email
+
     def avatar(self, size):
-        digest = md5(self.email.lower().encode()).hexdigest()
+        if current_app.config["AVATARS_LOCAL"]:
+            return url_for("core.avatar", digest=self.email_hash, size=size)
+
         return "https://www.gravatar.com/avatar/{}?d=identicon&s={}".format(
-            digest, size
+            self.email_hash, size
         )
 
     def is_following(self, user):
-        return self.followed.filter(
-            followers.c.followed_id == user.id
-        ).count() > 0
+        return user.id in follow_graph.followed_ids(self.id)
 
     def follow(self, user):
-        if not self.is_following(user):
-            self.followed.append(user)
+        # decided by the database, the cached graph may lag behind other
+        # processes; the statement inserts nothing if the edge exists
+        existing = (
+            select(followers)
+            .where(followers.c.follower_id == self.id)
+            .where(followers.c.followed_id == user.id)
+            .exists()
+        )
+        result = db.session.execute(
+            followers.insert().from_select(
+                ["follower_id", "followed_id"],
+                select(literal(self.id), literal(user.id)).where(~existing),
+            )
+        )
+        follow_graph.invalidate(self.id)
+
+        if result.rowcount:
+            self._count_follow(user, 1)
+
+            if not user.timeline_pull:
+                self._backfill_timeline(user)
 
     def unfollow(self, user):
-        if self.is_following(user):
-            self.followed.remove(user)
+        result = db.session.execute(
+            followers.delete()
+            .where(followers.c.follower_id == self.id)
+            .where(followers.c.followed_id == user.id)
+        )
+        follow_graph.invalidate(self.id)
 
-    def followed_posts(self):
+        if result.rowcount:
+            self._count_follow(user, -1)
+            self._prune_timeline(user)
+
+    def _count_follow(self, user, delta: int) -> None:
+        """Shift follow counters of both ends of an edge by `delta`."""
+
+        identity_cache.invalidate(User, self.id)
+        identity_cache.invalidate(User, user.id)
+
+        db.session.execute(
+            update(User)
+            .where(User.id == self.id)
+            .values(followed_count=User.followed_count + delta)
+        )
+        db.session.execute(
+            update(User)
+            .where(User.id == user.id)
+            .values(followers_count=User.followers_count + delta)
+        )
+
+    @staticmethod
+    def rebuild_counters() -> None:
+        """Recompute follow and post counters of all users in bulk."""
+
+        followers_count = (
+            select(func.count())
+            .where(followers.c.followed_id == User.id)
+            .scalar_subquery()
+        )
+        followed_count = (
+            select(func.count())
+            .where(followers.c.follower_id == User.id)
+            .scalar_subquery()
+        )
+        posts_count = (
+            select(func.count()).where(Post.user_id == User.id).scalar_subquery()
+        )
+
+        db.session.execute(
+            update(User).values(
+                followers_count=followers_count,
+                followed_count=followed_count,
+                posts_count=posts_count,
+            ),
+            execution_options={"synchronize_session": False},
+        )
+
+    @staticmethod
+    def rebuild_timelines() -> None:
+        """Recompute all materialized timelines from posts and follows.
+
+        Accounts with more than TIMELINE_FANOUT_LIMIT followers are moved to
+        the pull path first, so follower counters must be up to date.
+        """
+
+        db.session.execute(
+            update(User).values(
+                timeline_pull=User.followers_count
+                > current_app.config["TIMELINE_FANOUT_LIMIT"]
+            ),
+            execution_options={"synchronize_session": False},
+        )
+        db.session.execute(timeline.delete())
+
+        columns = ["user_id", "post_id", "timestamp"]
+        own = select(Post.user_id, Post.id, Post.timestamp)
         followed = (
-            Post.query
-            .join(followers, (followers.c.followed_id == Post.user_id))
-            .filter(followers.c.follower_id == self.id)
+            select(followers.c.follower_id, Post.id, Post.timestamp)
+            .select_from(followers)
+            .join(Post, Post.user_id == followers.c.followed_id)
+            .join(User, User.id == followers.c.followed_id)
+            .where(User.timeline_pull.is_(False))
+            .where(followers.c.follower_id != followers.c.followed_id)
         )
-        own = Post.query.filter_by(user_id=self.id)
+        db.session.execute(timeline.insert().from_select(columns, own))
+        db.session.execute(timeline.insert().from_select(columns, followed))
+
+        follow_graph.invalidate_pull_ids()
+
+    def home_timeline(self) -> tuple:
+        """Return the home feed query and the key columns it is ordered by.
+
+        Posts are read from the materialized timeline. Posts of followed
+        accounts that are on the pull path are merged in at read time.
+
+        Returns:
+            tuple: unordered query and a `(timestamp, id)` pair of columns
+        """
+
+        pulled = self._pulled_followed_ids()
 
-        return followed.union(own).order_by(Post.timestamp.desc())
+        if not pulled:
+            query = Post.query.join(timeline, timeline.c.post_id == Post.id).filter(
+                timeline.c.user_id == self.id
+            )
+            return query, (timeline.c.timestamp, timeline.c.post_id)
+
+        pushed = select(timeline.c.post_id).where(timeline.c.user_id == self.id)
+        query = Post.query.filter(or_(Post.id.in_(pushed), Post.user_id.in_(pulled)))
+
+        return query, (Post.timestamp, Post.id)
+
+    def followed_posts(self):
+        """Return posts of followed users and own posts, newest first."""
+
+        query, key = self.home_timeline()
+        return query.order_by(*(column.desc() for column in key))
+
+    def _pulled_followed_ids(self) -> list:
+        """Return ids of followed accounts which are on the pull path."""
+
+        pulled = follow_graph.followed_ids(self.id) & follow_graph.pull_ids()
+        return sorted(pulled)
+
+    def _backfill_timeline(self, user) -> None:
+        """Copy the most recent posts of `user` into own timeline."""
+
+        already_there = (
+            select(timeline.c.post_id)
+            .where(timeline.c.user_id == self.id)
+            .where(timeline.c.post_id == Post.id)
+            .exists()
+        )
+        recent = (
+            select(literal(self.id), Post.id, Post.timestamp)
+            .where(Post.user_id == user.id)
+            .where(~already_there)
+            .order_by(Post.timestamp.desc())
+            .limit(current_app.config["TIMELINE_BACKFILL_LIMIT"])
+        )
+
+        db.session.execute(
+            timeline.insert().from_select(["user_id", "post_id", "timestamp"], recent)
+        )
+
+    def _prune_timeline(self, user) -> None:
+        """Remove posts of `user` from own timeline."""
+
+        db.session.execute(
+            timeline.delete()
+            .where(timeline.c.user_id == self.id)
+            .where(timeline.c.post_id.in_(select(Post.id).where(Post.user_id == user.id)))
+        )
 
 
 @login.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    return identity_cache.load(User, int(id))
 
 
 class Post(db.Model):
@@ -111,5 +323,169 @@ class Post(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     language = db.Column(db.String(5))
 
+    __table_args__ = (
+        db.Index("ix_post_user_id_timestamp", "user_id", "timestamp"),
+        # posts waiting for language detection, see `LanguageDetector`
+        db.Index(
+            "ix_post_language_pending",
+            "id",
+            sqlite_where=db.text("language IS NULL"),
+            postgresql_where=db.text("language IS NULL"),
+        ),
+    )
+
     def __repr__(self):
         return f"<Post {self.body}>"
+
+    @staticmethod
+    def load_authors(posts: list) -> list:
+        """Load authors of a page of posts with a single query.
+
+        Authors already present in the session are reused, the rest are
+        fetched at once and attached to `Post.author`, so rendering the page
+        does not lazy-load an author per post.
+
+        Args:
+            posts (list): posts to hydrate
+
+        Returns:
+            list: the same posts
+        """
+
+        unloaded = [post for post in posts if "author" not in post.__dict__]
+
+        authors = {}
+        for post in unloaded:
+            author = db.session.identity_map.get(identity_key(User, post.user_id))
+            if author is not None:
+                authors[post.user_id] = author
+
+        missing = {post.user_id for post in unloaded} - set(authors)
+        if missing:
+            authors.update(
+                (author.id, author)
+                for author in User.query.filter(User.id.in_(missing))
+            )
+
+        for post in unloaded:
+            set_committed_value(post, "author", authors.get(post.user_id))
+
+        return posts
+
+
+# the FTS5 search index lives and dies with the `post` table on SQLite
+event.listen(
+    Post.__table__, "after_create", DDL(FTS_CREATE).execute_if(dialect="sqlite")
+)
+event.listen(
+    Post.__table__, "before_drop", DDL(FTS_DROP).execute_if(dialect="sqlite")
+)
+
+
+@event.listens_for(Post, "after_insert")
+def fan_out_post(mapper, connection, post: Post) -> None:
+    """Write a freshly inserted post into the timelines of its readers.
+
+    The author always gets the post. Followers get it too, unless the author
+    is on the pull path or has more than TIMELINE_FANOUT_LIMIT followers, in
+    which case the author is switched to the pull path for good. Followers
+    are only read for authors on the push path. The author's post counter is
+    bumped and the post is added to the search index in the same transaction.
+    Cached explore pages are dropped.
+    """
+
+    connection.execute(
+        User.__table__.update()
+        .where(User.id == post.user_id)
+        .values(posts_count=User.posts_count + 1)
+    )
+    identity_cache.invalidate(User, post.user_id)
+
+    readers = [post.user_id]
+
+    author = connection.execute(
+        select(User.timeline_pull, User.followers_count).where(User.id == post.user_id)
+    ).one()
+
+    pull = author.timeline_pull
+    limit = current_app.config["TIMELINE_FANOUT_LIMIT"]
+    if not pull and author.followers_count > limit:
+        connection.execute(
+            User.__table__.update()
+            .where(User.id == post.user_id)
+            .values(timeline_pull=True)
+        )
+        follow_graph.invalidate_pull_ids()
+        if post.author is not None:
+            set_committed_value(post.author, "timeline_pull", True)
+        pull = True
+
+    if not pull:
+        readers.extend(
+            connection.execute(
+                select(followers.c.follower_id)
+                .where(followers.c.followed_id == post.user_id)
+                .where(followers.c.follower_id != post.user_id)
+            ).scalars()
+        )
+
+    connection.execute(
+        timeline.insert(),
+        [
+            {"user_id": reader, "post_id": post.id, "timestamp": post.timestamp}
+            for reader in readers
+        ],
+    )
+
+    search_index.add(connection, post.id, post.body)
+    explore_cache.invalidate(db.session())
+
+
+class Translation(db.Model):
+    """Cached result of a machine translation."""
+
+    __tablename__ = "translation"
+
+    id = db.Column(db.Integer, primary_key=True)
+    body_hash = db.Column(db.String(64), nullable=False)
+    source_language = db.Column(db.String(5), nullable=False)
+    target_language = db.Column(db.String(5), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index(
+            "ix_translation_lookup",
+            "body_hash",
+            "source_language",
+            "target_language",
+            unique=True,
+        ),
+    )
+
+    def __repr__(self):
+        return f"<Translation {self.source_language}->{self.target_language}>"
+
+
+class OutboxMessage(db.Model):
+    """Email waiting in the outbox, see `app.outbox.MailOutbox`."""
+
+    __tablename__ = "outbox"
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255))
+    sender = db.Column(db.String(120))
+    recipients = db.Column(db.Text, nullable=False)
+    text_body = db.Column(db.Text)
+    html_body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # NULL once the message is sent or given up on
+    next_attempt_at = db.Column(db.DateTime, index=True)
+    claim_token = db.Column(db.String(32))
+    claimed_until = db.Column(db.DateTime)
+    sent_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f"<OutboxMessage {self.subject}>"
@@ -0,0 +1,232 @@
+import json
+from datetime import datetime, timedelta
+from threading import Condition, Lock, Thread
+from typing import List, Optional
+from uuid import uuid4
+
+from flask import Flask, current_app
+from flask_mail import Mail, Message
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import or_, select
+
+
+class MailOutbox:
+    """Durable outbox for email, drained by a bounded pool of workers.
+
+    Messages are stored in the `outbox` table and survive restarts. Each of
+    MAIL_OUTBOX_WORKERS threads claims up to MAIL_OUTBOX_BATCH_SIZE due
+    messages at a time and sends them over a single SMTP connection. Failed
+    messages are retried with exponential backoff until
+    MAIL_OUTBOX_MAX_ATTEMPTS is reached. With no workers configured,
+    messages are delivered by the caller right after being queued. Each
+    application has its own workers, bound to its database.
+    """
+
+    def __init__(self, db: SQLAlchemy, mail: Mail, app: Optional[Flask] = None):
+        self.db = db
+        self.mail = mail
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["mail_outbox"] = self
+        app.extensions["mail_outbox_workers"] = _Workers(app)
+
+        if app.config["MAIL_OUTBOX_WORKERS"]:
+            # pick up messages left over by a previous process
+            app.before_request(
+                lambda: self._start_workers(app.extensions["mail_outbox_workers"])
+            )
+
+    def enqueue(
+        self,
+        subject: str,
+        sender: str,
+        recipients: List[str],
+        text_body: str,
+        html_body: str,
+    ) -> None:
+        """Store a message in the outbox and wake up a worker.
+
+        Args:
+            subject (str): message subject
+            sender (str): sender address
+            recipients (List[str]): recipient addresses
+            text_body (str): plain text body
+            html_body (str): HTML body
+        """
+
+        outbox = self.db.metadata.tables["outbox"]
+        now = datetime.utcnow()
+
+        self.db.session.execute(
+            outbox.insert().values(
+                subject=subject,
+                sender=sender,
+                recipients=json.dumps(list(recipients)),
+                text_body=text_body,
+                html_body=html_body,
+                attempts=0,
+                created_at=now,
+                next_attempt_at=now,
+            )
+        )
+        self.db.session.commit()
+
+        if not current_app.config["MAIL_OUTBOX_WORKERS"]:
+            self.drain()
+            return
+
+        workers = current_app.extensions["mail_outbox_workers"]
+        self._start_workers(workers)
+        with workers.wake:
+            workers.wake.notify()
+
+    def drain(self, app: Optional[Flask] = None) -> int:
+        """Send due messages batch by batch until none are left.
+
+        Args:
+            app (Optional[Flask]): application, defaults to the current one
+
+        Returns:
+            int: number of messages sent
+        """
+
+        app = app or current_app._get_current_object()
+        sent = 0
+
+        while True:
+            batch = self._claim(app)
+            if not batch:
+                return sent
+            sent += self._send(app, batch)
+
+    def _claim(self, app: Flask) -> list:
+        """Lease a batch of due messages to the calling worker."""
+
+        outbox = self.db.metadata.tables["outbox"]
+        now = datetime.utcnow()
+        token = uuid4().hex
+        unclaimed = or_(outbox.c.claimed_until.is_(None), outbox.c.claimed_until < now)
+
+        due = (
+            select(outbox.c.id)
+            .where(outbox.c.next_attempt_at <= now)
+            .where(unclaimed)
+            .order_by(outbox.c.id)
+            .limit(app.config["MAIL_OUTBOX_BATCH_SIZE"])
+        )
+        lease = timedelta(seconds=app.config["MAIL_OUTBOX_LEASE"])
+
+        with self.db.get_engine(app).begin() as connection:
+            connection.execute(
+                outbox.update()
+                .where(outbox.c.id.in_(due))
+                .where(unclaimed)
+                .values(claim_token=token, claimed_until=now + lease)
+            )
+            return connection.execute(
+                select(outbox).where(outbox.c.claim_token == token)
+            ).all()
+
+    def _send(self, app: Flask, batch: list) -> int:
+        """Send a claimed batch over one SMTP connection and record results."""
+
+        results = {}
+
+        with app.app_context():
+            try:
+                with self.mail.connect() as connection:
+                    for row in batch:
+                        message = Message(
+                            row.subject,
+                            sender=row.sender,
+                            recipients=json.loads(row.recipients),
+                        )
+                        message.body = row.text_body
+                        message.html = row.html_body
+
+                        try:
+                            connection.send(message)
+                        except Exception as error:
+                            results[row.id] = repr(error)
+                        else:
+                            results[row.id] = None
+            except Exception as error:
+                # the connection itself failed, nothing left was sent
+                for row in batch:
+                    results.setdefault(row.id, repr(error))
+
+        self._record(app, batch, results)
+
+        return sum(1 for error in results.values() if error is None)
+
+    def _record(self, app: Flask, batch: list, results: dict) -> None:
+        outbox = self.db.metadata.tables["outbox"]
+        now = datetime.utcnow()
+
+        with self.db.get_engine(app).begin() as connection:
+            for row in batch:
+                error = results[row.id]
+                values = {"claim_token": None, "claimed_until": None}
+
+                if error is None:
+                    values.update(sent_at=now, next_attempt_at=None, last_error=None)
+                else:
+                    attempts = row.attempts + 1
+                    if attempts >= app.config["MAIL_OUTBOX_MAX_ATTEMPTS"]:
+                        retry_at = None
+                        app.logger.error(f"Giving up on outbox message {row.id}: {error}")
+                    else:
+                        backoff = app.config["MAIL_OUTBOX_BACKOFF"] * 2 ** (attempts - 1)
+                        retry_at = now + timedelta(seconds=backoff)
+                    values.update(
+                        attempts=attempts, next_attempt_at=retry_at, last_error=error
+                    )
+
+                connection.execute(
+                    outbox.update().where(outbox.c.id == row.id).values(**values)
+                )
+
+    def _start_workers(self, workers: "_Workers") -> None:
+        if workers.threads:
+            return
+
+        with workers.lock:
+            if workers.threads:
+                return
+
+            for number in range(workers.app.config["MAIL_OUTBOX_WORKERS"]):
+                thread = Thread(
+                    target=self._run,
+                    args=(workers,),
+                    name=f"mail-outbox-{number}",
+                    daemon=True,
+                )
+                thread.start()
+                workers.threads.append(thread)
+
+    def _run(self, workers: "_Workers") -> None:
+        app = workers.app
+        interval = app.config["MAIL_OUTBOX_POLL_INTERVAL"]
+
+        while True:
+            try:
+                self.drain(app)
+            except Exception:
+                app.logger.exception("Could not drain the mail outbox")
+
+            # sleep until a new message arrives or retries become due
+            with workers.wake:
+                workers.wake.wait(interval)
+
+
+class _Workers:
+    """Threads draining the outbox of one application."""
+
+    def __init__(self, app: Flask):
+        self.app = app
+        self.threads = []
+        self.lock = Lock()
+        self.wake = Condition()
@@ -0,0 +1,211 @@
+import base64
+import json
+import math
+from datetime import datetime
+from typing import Optional, Tuple
+
+from flask import abort, request, url_for
+from sqlalchemy import and_, or_
+
+# bounds of the SQLite INTEGER type, wider numbers cannot be bound
+MIN_INTEGER = -(2**63)
+MAX_INTEGER = 2**63 - 1
+# deepest legacy page number served, deeper ones are just as empty
+MAX_PAGE = 2**31
+
+
+def encode_cursor(values: tuple) -> str:
+    """Encode key values of a feed row as an opaque URL-safe cursor.
+
+    Args:
+        values (tuple): key values, e.g. `(timestamp, id)`
+
+    Returns:
+        str: cursor
+    """
+
+    payload = [
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor made by `encode_cursor`.
+
+    Args:
+        cursor (str): cursor
+
+    Raises:
+        ValueError: if cursor is malformed
+
+    Returns:
+        tuple: key values
+    """
+
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    values = json.loads(raw)
+
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("malformed cursor")
+
+    # a timestamp, or a score for ranked feeds, then an id
+    first, second = values
+    if isinstance(first, str):
+        first = datetime.fromisoformat(first)
+    elif not _is_number(first) or not math.isfinite(first):
+        raise ValueError("malformed cursor")
+    elif isinstance(first, int) and not _is_integer(first):
+        raise ValueError("malformed cursor")
+    if not _is_integer(second):
+        raise ValueError("malformed cursor")
+
+    return first, second
+
+
+def cursor_args() -> dict:
+    """Read pagination arguments of the current request.
+
+    A malformed page number is ignored, as for any other query argument,
+    and page numbers beyond MAX_PAGE are lowered to it.
+
+    Raises:
+        BadRequest: if a cursor is malformed
+
+    Returns:
+        dict: keyword arguments for `paginate`
+    """
+
+    page = request.args.get("page", type=int)
+    args = {"page": None if page is None else min(page, MAX_PAGE)}
+    for name in ("after", "before"):
+        cursor = request.args.get(name)
+        try:
+            args[name] = None if cursor is None else decode_cursor(cursor)
+        except ValueError:
+            abort(400, f"Malformed {name} cursor.")
+
+    return args
+
+
+class Page:
+    """A page of a feed with cursors pointing to its neighbours."""
+
+    def __init__(
+        self,
+        items: list,
+        next_cursor: Optional[str] = None,
+        prev_cursor: Optional[str] = None,
+    ):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+    def next_url(self, endpoint: str, **values) -> Optional[str]:
+        if not self.has_next:
+            return None
+        return url_for(endpoint, after=self.next_cursor, **values)
+
+    def prev_url(self, endpoint: str, **values) -> Optional[str]:
+        if not self.has_prev:
+            return None
+        return url_for(endpoint, before=self.prev_cursor, **values)
+
+
+def paginate(
+    query,
+    key: Tuple,
+    per_page: int,
+    after: Optional[tuple] = None,
+    before: Optional[tuple] = None,
+    page: Optional[int] = None,
+) -> Page:
+    """Paginate a feed query, newest first, without counting rows.
+
+    Pages are addressed by the key of a boundary row: `after` gives the page
+    of rows older than the cursor, `before` the page of rows newer than it.
+    A legacy 1-based `page` number is still accepted for old links, it is
+    served with an OFFSET query.
+
+    Args:
+        query: query returning feed items
+        key (Tuple): two columns uniquely ordering the feed, e.g.
+            `(Post.timestamp, Post.id)`
+        per_page (int): page size
+        after (Optional[tuple]): decoded cursor to page forward from
+        before (Optional[tuple]): decoded cursor to page backward from
+        page (Optional[int]): legacy page number
+
+    Returns:
+        Page: items and cursors of the neighbouring pages
+    """
+
+    first, second = key
+    query = query.add_columns(first, second).order_by(None)
+
+    if before is not None:
+        rows = (
+            query.filter(_newer_than(key, before))
+            .order_by(first.asc(), second.asc())
+            .limit(per_page + 1)
+            .all()
+        )
+        has_prev = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        query = query.order_by(first.desc(), second.desc())
+        has_prev = False
+
+        if after is not None:
+            query = query.filter(_older_than(key, after))
+            has_prev = True
+        elif page is not None and page > 1:
+            query = query.offset((page - 1) * per_page)
+            has_prev = True
+
+        rows = query.limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+
+    if not rows:
+        return Page([])
+
+    return Page(
+        [row[0] for row in rows],
+        next_cursor=encode_cursor(tuple(rows[-1])[-2:]) if has_next else None,
+        prev_cursor=encode_cursor(tuple(rows[0])[-2:]) if has_prev else None,
+    )
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_integer(value) -> bool:
+    return (
+        isinstance(value, int)
+        and not isinstance(value, bool)
+        and MIN_INTEGER <= value <= MAX_INTEGER
+    )
+
+
+def _older_than(key: Tuple, values: tuple):
+    first, second = key
+    return or_(first < values[0], and_(first == values[0], second < values[1]))
+
+
+def _newer_than(key: Tuple, values: tuple):
+    first, second = key
+    return or_(first > values[0], and_(first == values[0], second > values[1]))
@@ -0,0 +1,133 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from threading import BoundedSemaphore, Lock
+from typing import Optional, Tuple
+
+from flask import Flask
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash,
+)
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded pool of processes.
+
+    Key stretching burns CPU by design. Running it in PASSWORD_HASH_WORKERS
+    separate processes keeps request threads free to serve other requests
+    meanwhile. At most PASSWORD_HASH_MAX_PENDING operations may be running
+    or queued; beyond that callers get a 503 instead of waiting. New hashes
+    use PASSWORD_HASH_METHOD, and hashes made with other parameters are
+    reported by `needs_rehash`. With no workers, hashing runs in the caller.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.method = "pbkdf2:sha256:260000"
+        self.workers = 0
+        self._pool = None
+        self._pending = None
+        self._lock = Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.method = app.config["PASSWORD_HASH_METHOD"]
+        self.workers = app.config["PASSWORD_HASH_WORKERS"]
+        self._pending = BoundedSemaphore(app.config["PASSWORD_HASH_MAX_PENDING"])
+
+        app.extensions["password_hasher"] = self
+
+    def hash(self, password: str) -> str:
+        """Hash a password with the current hashing policy.
+
+        Args:
+            password (str): plain text password
+
+        Raises:
+            ServiceUnavailable: if too many operations are pending
+
+        Returns:
+            str: password hash
+        """
+
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        """Check a password against its hash.
+
+        Args:
+            password_hash (str): stored password hash
+            password (str): plain text password
+
+        Raises:
+            ServiceUnavailable: if too many operations are pending
+
+        Returns:
+            bool: whether the password matches
+        """
+
+        if not password_hash:
+            return False
+
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Tell whether a hash was made with other than the current policy.
+
+        Args:
+            password_hash (str): stored password hash
+
+        Returns:
+            bool: whether the password should be hashed again
+        """
+
+        method = password_hash.split("$", 1)[0]
+        return _parameters(method) != _parameters(self.method)
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+
+        if not self._pending.acquire(blocking=False):
+            raise ServiceUnavailable(
+                "Too many password operations in progress.", retry_after=1
+            )
+
+        try:
+            return self._executor().submit(function, *args).result()
+        finally:
+            self._pending.release()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # created on first use, so every forked server process gets its own;
+        # pool processes are not forked from this one, which runs threads
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        self.workers, mp_context=_start_context()
+                    )
+
+        return self._pool
+
+
+def _parameters(method: str) -> Tuple[str, Optional[str], Optional[int]]:
+    """Split a hashing method into scheme, digest and iterations, filling
+    in the defaults Werkzeug applies to the parts that are left out.
+    """
+
+    scheme, _, rest = method.partition(":")
+    if scheme != "pbkdf2":
+        return method, None, None
+
+    digest, _, iterations = rest.partition(":")
+    return scheme, digest or "sha256", int(iterations or DEFAULT_PBKDF2_ITERATIONS)
+
+
+def _start_context():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
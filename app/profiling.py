@@ -0,0 +1,172 @@
+import random
+import time
+from functools import wraps
+from typing import Optional
+
+from flask import (
+    Flask,
+    before_render_template,
+    current_app,
+    g,
+    has_request_context,
+    request,
+    request_started,
+    template_rendered,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestProfiler:
+    """Opt-in per-request profiling of SQL, templates and `before_request`.
+
+    With PROFILING_ENABLED set, a PROFILING_SAMPLE_RATE share of requests
+    records the number of queries, time spent in SQL, in rendering top-level
+    templates, in `before_request` handlers and in total. The numbers are
+    returned in a `Server-Timing` header and logged as a structured record.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self._listening = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["profiler"] = self
+
+        if not app.config["PROFILING_ENABLED"]:
+            return
+
+        if not self._listening:
+            # engine events are global, requests that are not sampled skip them
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            self._listening = True
+
+        request_started.connect(self._start, app)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.preprocess_request = self._time_preprocess(app.preprocess_request)
+        app.after_request(self._finish)
+
+    def annotate(self, name: str, value: str) -> None:
+        """Attach a value to the profile of the current request, if sampled.
+
+        Args:
+            name (str): metric name
+            value (str): description shown in `Server-Timing` and logs
+        """
+
+        profile = self._profile()
+        if profile is not None:
+            profile["annotations"][name] = value
+
+    def _profile(self) -> Optional[dict]:
+        if not has_request_context():
+            return None
+        return g.get("_profile")
+
+    def _start(self, app: Flask, **extra) -> None:
+        # `g` outlives the request when an app context was already pushed
+        g._profile = None
+
+        if random.random() >= app.config["PROFILING_SAMPLE_RATE"]:
+            return
+
+        g._profile = {
+            "started": time.perf_counter(),
+            "sql_count": 0,
+            "sql_time": 0.0,
+            "render_time": 0.0,
+            "render_depth": 0,
+            "before_request_time": 0.0,
+            "annotations": {},
+        }
+
+    def _time_preprocess(self, preprocess_request):
+        @wraps(preprocess_request)
+        def timed():
+            started = time.perf_counter()
+            try:
+                return preprocess_request()
+            finally:
+                profile = self._profile()
+                if profile is not None:
+                    profile["before_request_time"] += time.perf_counter() - started
+
+        return timed
+
+    def _before_cursor_execute(self, conn, cursor, statement, *args) -> None:
+        if self._profile() is not None:
+            conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, *args) -> None:
+        profile = self._profile()
+        if profile is None or not conn.info.get("profile_started"):
+            return
+
+        profile["sql_count"] += 1
+        profile["sql_time"] += time.perf_counter() - conn.info["profile_started"].pop()
+
+    def _before_render(self, app: Flask, template, context) -> None:
+        profile = self._profile()
+        if profile is None:
+            return
+
+        # templates included by other templates are already being timed
+        if profile["render_depth"] == 0:
+            profile["render_started"] = time.perf_counter()
+        profile["render_depth"] += 1
+
+    def _after_render(self, app: Flask, template, context) -> None:
+        profile = self._profile()
+        if profile is None or not profile["render_depth"]:
+            return
+
+        profile["render_depth"] -= 1
+        if profile["render_depth"] == 0:
+            profile["render_time"] += time.perf_counter() - profile["render_started"]
+
+    def _finish(self, response):
+        profile = self._profile()
+        if profile is None:
+            return response
+        g._profile = None
+
+        total = time.perf_counter() - profile["started"]
+        metrics = [
+            ("sql", profile["sql_time"], f"{profile['sql_count']} queries"),
+            ("render", profile["render_time"], "templates"),
+            ("before", profile["before_request_time"], "before_request"),
+            ("total", total, None),
+        ]
+
+        timings = []
+        for name, duration, description in metrics:
+            timing = f"{name};dur={duration * 1000:.1f}"
+            if description:
+                timing += f';desc="{description}"'
+            timings.append(timing)
+        for name, value in profile["annotations"].items():
+            timings.append(f'{name};desc="{value}"')
+        response.headers.add("Server-Timing", ", ".join(timings))
+
+        current_app.logger.info(
+            "Request profile",
+            extra={
+                "data": {
+                    "endpoint": request.endpoint,
+                    "method": request.method,
+                    "status": response.status_code,
+                    "sql_count": profile["sql_count"],
+                    "sql_ms": round(profile["sql_time"] * 1000, 2),
+                    "render_ms": round(profile["render_time"] * 1000, 2),
+                    "before_request_ms": round(profile["before_request_time"] * 1000, 2),
+                    "total_ms": round(total * 1000, 2),
+                    **profile["annotations"],
+                }
+            },
+        )
+
+        return response
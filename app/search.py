@@ -0,0 +1,190 @@
+import re
+from collections import Counter
+from typing import Iterator, List, Optional
+
+from flask import Flask, current_app
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import column, extract, func, literal_column, select, table, text
+
+# External content FTS5 table over `post.body`: it stores only the index,
+# bodies are read from the `post` table. Rows are added as posts are created.
+FTS_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5("
+    "body, content='post', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+)
+FTS_DROP = "DROP TABLE IF EXISTS post_fts"
+
+post_fts = table("post_fts", column("rowid"), column("body"))
+
+TERM_LENGTH = 64
+
+
+class SearchIndex:
+    """Full-text index of post bodies.
+
+    On SQLite posts are indexed by the FTS5 table `post_fts`, elsewhere by
+    the `search_term` inverted index table. SEARCH_BACKEND forces either
+    backend, `fts5` or `inverted`. Results are ranked by relevance, boosted
+    by SEARCH_RECENCY_WEIGHT for every day a post is newer than another.
+    """
+
+    def __init__(self, db: SQLAlchemy, app: Optional[Flask] = None):
+        self.db = db
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["search_index"] = self
+
+    def backend(self, connection=None) -> str:
+        """Return the backend used with the current database.
+
+        Args:
+            connection: connection to inspect, defaults to the app's engine
+
+        Returns:
+            str: `fts5` or `inverted`
+        """
+
+        if current_app.config["SEARCH_BACKEND"]:
+            return current_app.config["SEARCH_BACKEND"]
+
+        dialect = (connection or self.db.engine).dialect
+        return "fts5" if dialect.name == "sqlite" else "inverted"
+
+    def add(self, connection, post_id: int, body: str) -> None:
+        """Index a new post within the transaction that inserts it.
+
+        Args:
+            connection: connection of the inserting transaction
+            post_id (int): post id
+            body (str): post body
+        """
+
+        if self.backend(connection) == "fts5":
+            connection.execute(
+                text("INSERT INTO post_fts (rowid, body) VALUES (:id, :body)"),
+                {"id": post_id, "body": body or ""},
+            )
+            return
+
+        rows = _term_rows(post_id, body)
+        if rows:
+            connection.execute(self.db.metadata.tables["search_term"].insert(), rows)
+
+    def rebuild(self, batch_size: int) -> Iterator[int]:
+        """Rebuild the whole index from the `post` table.
+
+        Args:
+            batch_size (int): posts indexed per transaction
+
+        Yields:
+            int: total number of indexed posts after each batch
+        """
+
+        post = self.db.metadata.tables["post"]
+
+        if self.backend() == "fts5":
+            with self.db.engine.begin() as connection:
+                connection.execute(
+                    text("INSERT INTO post_fts (post_fts) VALUES ('rebuild')")
+                )
+                total = connection.execute(
+                    select(func.count()).select_from(post)
+                ).scalar()
+            yield total
+            return
+
+        terms = self.db.metadata.tables["search_term"]
+        with self.db.engine.begin() as connection:
+            connection.execute(terms.delete())
+
+        total = 0
+        with self.db.engine.connect() as reader:
+            result = reader.execution_options(
+                stream_results=True, yield_per=batch_size
+            ).execute(select(post.c.id, post.c.body).order_by(post.c.id))
+
+            for posts in result.partitions():
+                rows = [
+                    row for post_id, body in posts for row in _term_rows(post_id, body)
+                ]
+                if rows:
+                    with self.db.engine.begin() as connection:
+                        connection.execute(terms.insert(), rows)
+
+                total += len(posts)
+                yield total
+
+    def search(self, query: str) -> tuple:
+        """Return the query of posts matching all words of `query`.
+
+        Args:
+            query (str): search text
+
+        Returns:
+            tuple: unordered post query and a `(score, id)` pair of columns
+                to paginate it by
+        """
+
+        # models import this module to hook the FTS table to `post`
+        from app.models import Post
+
+        words = _tokenize(query)
+        if not words:
+            return Post.query.filter(False), (Post.timestamp, Post.id)
+
+        if self.backend() == "fts5":
+            # quoted, so that FTS5 takes every word as a plain term
+            match = " ".join(f'"{word}"' for word in words)
+            matches = (
+                select(
+                    post_fts.c.rowid.label("post_id"),
+                    (-func.bm25(literal_column("post_fts"))).label("relevance"),
+                )
+                .where(literal_column("post_fts").op("MATCH")(match))
+                .subquery()
+            )
+        else:
+            terms = self.db.metadata.tables["search_term"]
+            matches = (
+                select(
+                    terms.c.post_id,
+                    func.sum(terms.c.frequency).label("relevance"),
+                )
+                .where(terms.c.term.in_(set(words)))
+                .group_by(terms.c.post_id)
+                .having(func.count() == len(set(words)))
+                .subquery()
+            )
+
+        weight = current_app.config["SEARCH_RECENCY_WEIGHT"]
+        score = matches.c.relevance + weight * self._days(Post.timestamp)
+
+        return Post.query.join(matches, matches.c.post_id == Post.id), (score, Post.id)
+
+    def _days(self, timestamp):
+        """Return `timestamp` as a number of days since a fixed epoch."""
+
+        if self.db.engine.dialect.name == "sqlite":
+            return func.julianday(timestamp)
+
+        return extract("epoch", timestamp) / 86400.0
+
+
+def include_object(object, name: str, type_: str, reflected: bool, compare_to) -> bool:
+    """Keep the FTS5 tables out of migrations autogenerated by Alembic."""
+
+    return not (type_ == "table" and reflected and name.startswith("post_fts"))
+
+
+def _tokenize(body: Optional[str]) -> List[str]:
+    return [word[:TERM_LENGTH] for word in re.findall(r"\w+", (body or "").lower())]
+
+
+def _term_rows(post_id: int, body: Optional[str]) -> List[dict]:
+    return [
+        {"term": term, "post_id": post_id, "frequency": frequency}
+        for term, frequency in Counter(_tokenize(body)).items()
+    ]
@@ -0,0 +1,250 @@
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional, Set
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from app import db, last_seen_recorder
+from app.log import restart_queued_logging, stop_queued_logging
+from app.warmup import warm_up
+
+# set for a master re-executing itself on reload
+LISTEN_FD = "MICROBLOG_LISTEN_FD"
+RETIRING_WORKERS = "MICROBLOG_RETIRING_WORKERS"
+# a worker failing sooner than this after its start counts as a crash loop
+BOOT_TIME = 5
+MAX_RESPAWN_DELAY = 30
+
+logger = logging.getLogger(__name__)
+
+
+class PreforkServer:
+    """Pre-forking WSGI server: a master process and single-threaded workers.
+
+    The master loads and warms up the app, opens the listening socket and
+    forks the workers, which accept connections from that shared socket.
+    A dead worker is replaced, and a worker exits by itself after
+    `max_requests` requests, plus a random jitter, to bound memory growth;
+    with `max_requests` set to 0 workers are never recycled.
+    Workers failing right after they start are replaced with an
+    exponentially growing delay, of up to MAX_RESPAWN_DELAY seconds.
+
+    SIGTERM and SIGINT stop the server gracefully: workers finish their
+    current request, and are killed after `graceful_timeout` seconds.
+    SIGHUP reloads the code without downtime: the master re-executes itself
+    keeping the socket and the old workers, which go on serving until the
+    new workers are up and are then stopped gracefully.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        workers: Optional[int] = None,
+        max_requests: int = 1000,
+        max_requests_jitter: int = 0,
+        graceful_timeout: float = 30,
+    ):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or (os.cpu_count() or 1) * 2 + 1
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+
+        self._listener = None
+        self._children: Set[int] = set()
+        self._retiring: Set[int] = set()
+        self._started: Dict[int, float] = {}
+        self._failures = 0
+        self._respawn_at = 0.0
+        self._signal = None
+
+    def run(self) -> None:
+        """Serve until stopped by a signal."""
+
+        self._listener = self._listen()
+        self._retiring = _inherited_workers()
+
+        if "warmup" not in self.app.extensions:
+            warm_up(self.app)
+        # connections opened so far must not be shared with the workers
+        _dispose_engines(self.app, close=True)
+
+        for name in ("SIGTERM", "SIGINT", "SIGHUP"):
+            signal.signal(getattr(signal, name), self._on_signal)
+
+        logger.info(
+            "Serving on %s:%s with %d workers",
+            *self._listener.getsockname()[:2],
+            self.workers,
+        )
+
+        self._spawn_workers()
+        # the workers of the previous generation have been replaced
+        self._kill(self._retiring, signal.SIGTERM)
+
+        while self._signal is None:
+            self._reap()
+            self._spawn_workers()
+            time.sleep(0.1)
+
+        if self._signal == signal.SIGHUP:
+            self._reload()
+
+        self._stop()
+
+    def _listen(self) -> socket.socket:
+        fd = os.environ.pop(LISTEN_FD, None)
+        if fd is not None:
+            listener = socket.socket(fileno=int(fd))
+        else:
+            listener = socket.create_server((self.host, self.port), backlog=2048)
+
+        # workers poll the socket, only one of them wins each connection
+        listener.setblocking(False)
+        return listener
+
+    def _on_signal(self, signum: int, frame) -> None:
+        self._signal = signum
+
+    def _reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+
+            started = self._started.pop(pid, None)
+            if pid in self._children and self._signal is None:
+                logger.info("Worker %d exited with status %d", pid, status)
+                self._count_failure(status, started)
+            self._children.discard(pid)
+            self._retiring.discard(pid)
+
+    def _count_failure(self, status: int, started: Optional[float]) -> None:
+        now = time.monotonic()
+        if not status or started is None or now - started >= BOOT_TIME:
+            self._failures = 0
+            return
+
+        self._failures += 1
+        delay = min(0.1 * 2 ** self._failures, MAX_RESPAWN_DELAY)
+        self._respawn_at = now + delay
+        logger.error("Worker failed on start, respawning in %.1f seconds", delay)
+
+    def _spawn_workers(self) -> None:
+        if time.monotonic() < self._respawn_at:
+            return
+
+        while len(self._children) < self.workers:
+            pid = os.fork()
+            if pid == 0:
+                self._work()
+            self._children.add(pid)
+            self._started[pid] = time.monotonic()
+
+    def _work(self) -> None:
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+        signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        status = 0
+        try:
+            restart_queued_logging(self.app)
+            _dispose_engines(self.app, close=False)
+
+            served = 0
+            limit = self._request_limit()
+
+            def counted(environ, start_response):
+                nonlocal served
+                served += 1
+                return self.app(environ, start_response)
+
+            server = make_server(
+                self.host, self.port, counted, fd=self._listener.fileno()
+            )
+            server.timeout = 1
+            while not stopping and (limit is None or served < limit):
+                server.handle_request()
+            server.server_close()
+        except Exception:
+            logger.exception("Worker %d failed", os.getpid())
+            status = 1
+        finally:
+            _flush(self.app)
+            os._exit(status)
+
+    def _request_limit(self) -> Optional[int]:
+        # 0 turns recycling off, as the jitter alone could make the limit 0
+        if self.max_requests <= 0:
+            return None
+
+        return self.max_requests + random.randint(0, self.max_requests_jitter)
+
+    def _reload(self) -> None:
+        logger.info("Reloading")
+        _flush(self.app)
+
+        self._listener.set_inheritable(True)
+        os.environ[LISTEN_FD] = str(self._listener.fileno())
+        os.environ[RETIRING_WORKERS] = ",".join(
+            str(pid) for pid in self._children | self._retiring
+        )
+        os.execv(sys.executable, [sys.executable, *sys.orig_argv[1:]])
+
+    def _stop(self) -> None:
+        workers = self._children | self._retiring
+        self._kill(workers, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.graceful_timeout
+        while (self._children or self._retiring) and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+
+        self._kill(self._children | self._retiring, signal.SIGKILL)
+        self._reap()
+        self._listener.close()
+
+    def _kill(self, pids: Set[int], signum: int) -> None:
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+
+def _inherited_workers() -> Set[int]:
+    pids = os.environ.pop(RETIRING_WORKERS, "")
+    return {int(pid) for pid in pids.split(",") if pid}
+
+
+def _flush(app: Flask) -> None:
+    """Write out what background threads hold, as `os._exit` and `os.execv`
+    skip the exit handlers doing it otherwise."""
+
+    try:
+        last_seen_recorder.flush(app)
+    except Exception:
+        logger.exception("Could not flush last seen updates")
+
+    stop_queued_logging(app)
+
+
+def _dispose_engines(app: Flask, close: bool) -> None:
+    binds: Dict = app.config["SQLALCHEMY_BINDS"] or {}
+    with app.app_context():
+        for bind in [None, *binds]:
+            db.get_engine(app, bind=bind).dispose(close=close)
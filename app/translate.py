@@ -1,11 +1,22 @@
+from collections import defaultdict
+from hashlib import sha256
+from typing import Iterable, List, Optional
+
 from flask import current_app
 from flask_babel import _
+from sqlalchemy.exc import IntegrityError
 import requests
 
+from app import db, translation_cache
+from app.models import Post, Translation
+
 
 def translate(text: str, source_language: str, target_language: str) -> str:
     """Translate text using Yandex Translate service.
 
+    Results are cached in the `translation` table, fronted by an in-process
+    LRU cache, so repeated translations do not call the service.
+
     Args:
         text (str): text to translate
         source_language (str): ISO 649-1 source language code
@@ -15,33 +26,151 @@ def translate(text: str, source_language: str, target_language: str) -> str:
         str: translated text
     """
 
-    token = current_app.config["YANDEX_TRANSLATE_TOKEN"]
-    if token is None:
+    key = (_hash(text), source_language, target_language)
+
+    cached = translation_cache.get(key)
+    if cached is not None:
+        return cached
+
+    stored = Translation.query.filter_by(
+        body_hash=key[0],
+        source_language=source_language,
+        target_language=target_language,
+    ).first()
+    if stored is not None:
+        translation_cache.set(key, stored.text)
+        return stored.text
+
+    if current_app.config["YANDEX_TRANSLATE_TOKEN"] is None:
         return _("Yandex Translate Token is not set up")
 
-    folder_id = current_app.config["YANDEX_TRANSLATE_FOLDER_ID"]
-    if folder_id is None:
+    if current_app.config["YANDEX_TRANSLATE_FOLDER_ID"] is None:
         return _("Yandex Translate Folder ID is not set up")
 
+    translated = _request_translations([text], source_language, target_language)
+    if translated is None:
+        return _("Could not translate text")
+
+    _store(key, translated[0])
+
+    return translated[0]
+
+
+def pretranslate(posts: Iterable[Post], languages: List[str]) -> int:
+    """Translate posts into all `languages` ahead of time, in batches.
+
+    Translations which are already cached are skipped.
+
+    Args:
+        posts (Iterable[Post]): posts with a detected language
+        languages (List[str]): ISO 649-1 target language codes
+
+    Returns:
+        int: number of new translations
+    """
+
+    pending = defaultdict(dict)
+    for post in posts:
+        for target_language in languages:
+            if post.language and post.language != target_language:
+                pending[(post.language, target_language)][_hash(post.body)] = post.body
+
+    batch_size = current_app.config["TRANSLATE_BATCH_SIZE"]
+    count = 0
+
+    for (source_language, target_language), texts in pending.items():
+        known = {
+            row.body_hash
+            for row in Translation.query.filter(
+                Translation.body_hash.in_(texts),
+                Translation.source_language == source_language,
+                Translation.target_language == target_language,
+            )
+        }
+        missing = [(digest, text) for digest, text in texts.items() if digest not in known]
+
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            translated = _request_translations(
+                [text for _digest, text in batch], source_language, target_language
+            )
+            if translated is None:
+                continue
+
+            for (digest, _text), result in zip(batch, translated):
+                _store((digest, source_language, target_language), result)
+                count += 1
+
+    return count
+
+
+def _request_translations(
+    texts: List[str], source_language: str, target_language: str
+) -> Optional[List[str]]:
+    """Call the translation service.
+
+    Returns:
+        Optional[List[str]]: translated texts, in the order of `texts`, or
+            None on failure, including a malformed or incomplete reply
+    """
+
     body = {
         "sourceLanguageCode": source_language,
         "targetLanguageCode": target_language,
-        "texts": [text],
-        "folderId": folder_id,
+        "texts": texts,
+        "folderId": current_app.config["YANDEX_TRANSLATE_FOLDER_ID"],
     }
 
     headers = {
         "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}",
+        "Authorization": f"Bearer {current_app.config['YANDEX_TRANSLATE_TOKEN']}",
     }
 
-    response = requests.post(
-        "https://translate.api.cloud.yandex.net/translate/v2/translate",
-        json=body,
-        headers=headers,
-    )
+    try:
+        response = requests.post(
+            current_app.config["YANDEX_TRANSLATE_URL"],
+            json=body,
+            headers=headers,
+            timeout=current_app.config["TRANSLATE_TIMEOUT"],
+        )
+    except requests.RequestException:
+        return None
 
     if response.status_code != 200:
-        return _("Could not translate text")
+        return None
+
+    try:
+        translated = [item["text"] for item in response.json()["translations"]]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    if len(translated) != len(texts):
+        return None
+    if not all(isinstance(text, str) for text in translated):
+        return None
+
+    return translated
+
+
+def _store(key: tuple, text: str) -> None:
+    body_hash, source_language, target_language = key
+
+    db.session.add(
+        Translation(
+            body_hash=body_hash,
+            source_language=source_language,
+            target_language=target_language,
+            text=text,
+        )
+    )
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # stored concurrently by another worker
+        db.session.rollback()
+
+    translation_cache.set(key, text)
+
 
-    print(response.text)
+def _hash(text: str) -> str:
+    return sha256(text.encode()).hexdigest()
@@ -0,0 +1,41 @@
+from typing import Optional
+
+from flask import Flask
+
+from app.cache import LRUCache
+
+
+class TranslationCache:
+    """In-process LRU cache of machine translations.
+
+    Fronts the `translation` table, keyed by `(body hash, source language,
+    target language)` and holding up to TRANSLATION_CACHE_SIZE texts.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self._cache = LRUCache()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self._cache = LRUCache(app.config["TRANSLATION_CACHE_SIZE"])
+
+        app.extensions["translation_cache"] = self
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def get(self, key: tuple) -> Optional[str]:
+        return self._cache.get(key)
+
+    def set(self, key: tuple, text: str) -> None:
+        self._cache.set(key, text)
+
+    def clear(self) -> None:
+        self._cache.clear()
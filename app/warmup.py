@@ -0,0 +1,75 @@
+import os
+import time
+from typing import Dict
+
+from flask import Flask
+from flask_babel import force_locale, get_translations
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy.orm import configure_mappers
+
+
+def enable_bytecode_cache(app: Flask) -> None:
+    """Keep compiled templates in JINJA_BYTECODE_CACHE_DIR across restarts.
+
+    Args:
+        app (Flask): application
+    """
+
+    directory = app.config["JINJA_BYTECODE_CACHE_DIR"]
+    if not directory:
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def warm_up(app: Flask) -> Dict[str, float]:
+    """Do the work a first request would otherwise do lazily.
+
+    Meant to run in a server's master process, so that forked workers share
+    the loaded data and serve their first request at full speed. No
+    database connection is opened, as those must not cross a fork. The
+    timings are kept in `app.extensions["warmup"]`.
+
+    Args:
+        app (Flask): application
+
+    Returns:
+        Dict[str, float]: seconds taken by each step
+    """
+
+    steps = {
+        "mappers": configure_mappers,
+        "langdetect": _load_language_profiles,
+        "translations": lambda: _load_translations(app),
+        "templates": lambda: _compile_templates(app),
+    }
+
+    timings = {}
+    for name, step in steps.items():
+        started = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - started
+
+    app.extensions["warmup"] = timings
+    return timings
+
+
+def _load_language_profiles() -> None:
+    from langdetect.detector_factory import init_factory
+
+    init_factory()
+
+
+def _load_translations(app: Flask) -> None:
+    # Flask-Babel keeps loaded catalogs for the lifetime of the process
+    with app.test_request_context():
+        for language in app.config["LANGUAGES"]:
+            with force_locale(language):
+                get_translations()
+
+
+def _compile_templates(app: Flask) -> None:
+    # compiled templates stay in the environment's cache and bytecode cache
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
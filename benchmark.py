@@ -0,0 +1,501 @@
+"""Load and latency benchmarks for the feed, profile and post paths.
+
+Seeds a synthetic social graph into a scratch database and drives the main
+pages through the Flask test client from concurrent client threads, e.g.:
+
+    python benchmark.py --users 1000 --posts 20000 --output bench.json
+
+Results are printed as a table and, with `--output`, written as JSON so
+runs on different commits can be compared. With `--startup`, the import,
+`create_app` and first requests of fresh processes are timed instead, with
+and without warm-up.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from hashlib import md5
+from itertools import accumulate
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db, last_seen_recorder
+from app.models import Post, User, followers
+from config import Config
+
+PASSWORD = "benchmark"
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua"
+).split()
+SCENARIOS = ("index", "explore", "user", "follow", "post")
+# cold: nothing preloaded, warm: warmed up with an empty bytecode cache,
+# restart: warmed up again with the bytecode cache left by the warm run
+STARTUP_MODES = ("cold", "warm", "restart")
+STARTUP_REQUESTS = (
+    ("login", "post", "/auth/login", {"username": "user1", "password": PASSWORD}),
+    ("explore", "get", "/explore", None),
+    ("post", "post", "/index", {"post": "first post of a new worker"}),
+)
+
+
+class BenchmarkConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    MAIL_OUTBOX_WORKERS = 0
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Return the nearest-rank percentile of `values`.
+
+    Args:
+        values (List[float]): samples
+        share (float): percentile as a fraction, e.g. 0.95
+
+    Returns:
+        float: percentile value
+    """
+
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(share * len(ordered)) - 1))
+    return ordered[index]
+
+
+def seed(users: int, posts: int, follows: int, alpha: float, rng: random.Random) -> None:
+    """Fill an empty database with users, follows and posts.
+
+    Follow targets and post authors are drawn from a Zipf-like popularity
+    ranking and out-degrees from a Pareto distribution, so a few accounts
+    gather most followers and posts, as on a real network.
+
+    Args:
+        users (int): number of users
+        posts (int): number of posts
+        follows (int): mean number of accounts followed by a user
+        alpha (float): Pareto shape of the out-degree distribution
+        rng (random.Random): random number generator
+    """
+
+    # one cheap hash for everybody, logging in is not what is measured
+    password_hash = generate_password_hash(PASSWORD, method="pbkdf2:sha256:1")
+    now = datetime.utcnow()
+
+    db.session.execute(
+        User.__table__.insert(),
+        [
+            {
+                "id": user_id,
+                "username": f"user{user_id}",
+                "email": f"user{user_id}@example.com",
+                "email_hash": md5(f"user{user_id}@example.com".encode()).hexdigest(),
+                "password_hash": password_hash,
+                "last_seen": now,
+            }
+            for user_id in range(1, users + 1)
+        ],
+    )
+
+    user_ids = list(range(1, users + 1))
+    popularity = list(accumulate(1 / rank for rank in range(1, users + 1)))
+    scale = follows * (alpha - 1) / alpha
+
+    edges = []
+    for follower_id in user_ids:
+        degree = min(users - 1, int(scale * rng.paretovariate(alpha)))
+        followed = set()
+        while len(followed) < degree:
+            followed.update(
+                followed_id
+                for followed_id in rng.choices(
+                    user_ids, cum_weights=popularity, k=degree - len(followed)
+                )
+                if followed_id != follower_id
+            )
+        edges.extend(
+            {"follower_id": follower_id, "followed_id": followed_id}
+            for followed_id in followed
+        )
+    if edges:
+        db.session.execute(followers.insert(), edges)
+
+    authors = rng.choices(user_ids, cum_weights=popularity, k=posts)
+    db.session.execute(
+        Post.__table__.insert(),
+        [
+            {
+                "body": " ".join(rng.choices(WORDS, k=rng.randint(3, 20))),
+                "timestamp": now - timedelta(seconds=rng.randint(0, 30 * 24 * 3600)),
+                "user_id": author_id,
+                "language": "la",
+            }
+            for author_id in authors
+        ],
+    )
+
+    User.rebuild_counters()
+    User.rebuild_timelines()
+    db.session.commit()
+
+
+def run(
+    users: int = 1000,
+    posts: int = 20000,
+    follows: int = 20,
+    alpha: float = 2.0,
+    clients: int = 10,
+    requests: int = 200,
+    warmup: int = 10,
+    random_seed: int = 42,
+    database: Optional[str] = None,
+) -> Dict:
+    """Seed a scratch database and measure every scenario.
+
+    Args:
+        users (int): number of users
+        posts (int): number of posts
+        follows (int): mean number of accounts followed by a user
+        alpha (float): Pareto shape of the out-degree distribution
+        clients (int): number of logged in users issuing requests
+            concurrently, each from its own thread
+        requests (int): measured requests per scenario
+        warmup (int): unmeasured requests per scenario
+        random_seed (int): seed of the random number generator
+        database (Optional[str]): database URI, defaults to a temporary
+            SQLite file
+
+    Returns:
+        Dict: parameters and per-scenario results
+    """
+
+    parameters = {
+        "users": users,
+        "posts": posts,
+        "follows": follows,
+        "alpha": alpha,
+        "clients": clients,
+        "requests": requests,
+        "warmup": warmup,
+        "seed": random_seed,
+    }
+    rng = random.Random(random_seed)
+
+    scratch = None
+    if database is None:
+        handle, scratch = tempfile.mkstemp(prefix="microblog-benchmark-", suffix=".db")
+        os.close(handle)
+        database = f"sqlite:///{scratch}"
+
+    class RunConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = database
+
+    app = create_app(RunConfig)
+
+    try:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            started = time.perf_counter()
+            seed(users, posts, follows, alpha, rng)
+            parameters["seed_seconds"] = round(time.perf_counter() - started, 3)
+
+            # background workers share the engine, only count client queries
+            queries = {}
+
+            def count(*args) -> None:
+                counted = queries.get(threading.get_ident())
+                if counted is not None:
+                    counted.append(None)
+
+            event.listen(db.engine, "before_cursor_execute", count)
+
+        sessions = []
+        for user_id in rng.sample(range(1, users + 1), min(clients, users)):
+            client = app.test_client()
+            response = client.post(
+                "/auth/login", data={"username": f"user{user_id}", "password": PASSWORD}
+            )
+            if response.status_code != 302:
+                raise RuntimeError(f"Could not log in as user{user_id}")
+            sessions.append(client)
+
+        popularity = list(accumulate(1 / rank for rank in range(1, users + 1)))
+
+        def request(scenario: str, client, rng: random.Random):
+            if scenario == "index":
+                return client.get("/index")
+            if scenario == "explore":
+                return client.get("/explore")
+
+            user_id = rng.choices(range(1, users + 1), cum_weights=popularity)[0]
+            if scenario == "user":
+                return client.get(f"/user/user{user_id}")
+            if scenario == "follow":
+                return client.post(f"/follow/user{user_id}")
+
+            body = " ".join(rng.choices(WORDS, k=rng.randint(3, 20)))
+            return client.post("/index", data={"post": body})
+
+        def drive(scenario: str, number: int, samples: list, start) -> None:
+            # a generator per client keeps the request mix reproducible
+            client_rng = random.Random(f"{random_seed}-{scenario}-{number}")
+            counted = queries[threading.get_ident()] = []
+            start.wait()
+
+            for _ in range(number, requests, len(sessions)):
+                del counted[:]
+                started = time.perf_counter()
+                response = request(scenario, sessions[number], client_rng)
+                latency = time.perf_counter() - started
+                samples.append((response.status_code, latency * 1000, len(counted)))
+
+        results = {}
+        for scenario in SCENARIOS:
+            for number in range(warmup):
+                request(scenario, sessions[number % len(sessions)], rng)
+
+            samples = []
+            start = threading.Barrier(len(sessions) + 1)
+            threads = [
+                threading.Thread(target=drive, args=(scenario, number, samples, start))
+                for number in range(len(sessions))
+            ]
+            for thread in threads:
+                thread.start()
+
+            start.wait()
+            started = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            queries.clear()
+
+            if len(samples) < requests:
+                raise RuntimeError(f"{scenario} requests failed")
+            for status_code, _, _ in samples:
+                if status_code >= 400:
+                    raise RuntimeError(f"{scenario} request failed with {status_code}")
+            latencies = [latency for _, latency, _ in samples]
+            counts = [count for _, _, count in samples]
+
+            results[scenario] = {
+                "requests": requests,
+                "p50_ms": round(percentile(latencies, 0.50), 3),
+                "p95_ms": round(percentile(latencies, 0.95), 3),
+                "p99_ms": round(percentile(latencies, 0.99), 3),
+                "mean_ms": round(sum(latencies) / len(latencies), 3),
+                "queries_mean": round(sum(counts) / len(counts), 2),
+                "queries_max": max(counts),
+                "throughput_rps": round(requests / elapsed, 1),
+            }
+    finally:
+        with app.app_context():
+            _settle(app)
+            db.session.remove()
+            db.get_engine(app).dispose()
+        if scratch is not None:
+            os.remove(scratch)
+
+    return {
+        "commit": _commit(),
+        "created": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "parameters": parameters,
+        "scenarios": results,
+    }
+
+
+def startup(users: int = 100, posts: int = 1000, random_seed: int = 42) -> Dict:
+    """Time the start and first requests of fresh processes in every mode.
+
+    Args:
+        users (int): number of users
+        posts (int): number of posts
+        random_seed (int): seed of the random number generator
+
+    Returns:
+        Dict: parameters and per-mode results, in milliseconds
+    """
+
+    parameters = {"users": users, "posts": posts, "seed": random_seed}
+    scratch = tempfile.mkdtemp(prefix="microblog-startup-")
+    database = f"sqlite:///{os.path.join(scratch, 'app.db')}"
+    bytecode_cache = os.path.join(scratch, "jinja")
+
+    class SeedConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = database
+
+    app = create_app(SeedConfig)
+    with app.app_context():
+        db.create_all()
+        seed(users, posts, 5, 2.0, random.Random(random_seed))
+        db.session.remove()
+        db.get_engine(app).dispose()
+
+    results = {}
+    try:
+        for mode in STARTUP_MODES:
+            probe = subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    "import sys, time; started = time.perf_counter(); "
+                    "import benchmark; benchmark.probe_startup(started, *sys.argv[1:])",
+                    database,
+                    "" if mode == "cold" else bytecode_cache,
+                ],
+                capture_output=True,
+                check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                text=True,
+            )
+            results[mode] = json.loads(probe.stdout.splitlines()[-1])
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {
+        "commit": _commit(),
+        "created": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "parameters": parameters,
+        "startup": results,
+    }
+
+
+def probe_startup(started: float, database: str, bytecode_cache: str) -> None:
+    """Create the app in this fresh process and print timings as JSON.
+
+    Args:
+        started (float): `time.perf_counter()` before the app was imported
+        database (str): database URI
+        bytecode_cache (str): template bytecode cache directory, empty for
+            a cold start without warm-up
+    """
+
+    imported = time.perf_counter()
+
+    class ProbeConfig(BenchmarkConfig):
+        SQLALCHEMY_DATABASE_URI = database
+        JINJA_BYTECODE_CACHE_DIR = bytecode_cache
+        WARMUP = bool(bytecode_cache)
+        LANGUAGE_DETECTION_SYNC = True
+        # the seeded hashes must not be upgraded on login
+        PASSWORD_HASH_METHOD = "pbkdf2:sha256:1"
+        PASSWORD_HASH_WORKERS = 0
+
+    app = create_app(ProbeConfig)
+    created = time.perf_counter()
+
+    result = {
+        "import_ms": round((imported - started) * 1000, 3),
+        "create_app_ms": round((created - imported) * 1000, 3),
+    }
+    client = app.test_client()
+    for name, method, url, data in STARTUP_REQUESTS:
+        requested = time.perf_counter()
+        response = getattr(client, method)(url, data=data)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name} request failed with {response.status_code}")
+        result[f"first_{name}_ms"] = round((time.perf_counter() - requested) * 1000, 3)
+
+    with app.app_context():
+        _settle(app)
+
+    print(json.dumps(result))
+
+
+def _settle(app, timeout: float = 10) -> None:
+    """Wait for background writers so the scratch database can go away."""
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not Post.query.filter(Post.language.is_(None)).count():
+            break
+        time.sleep(0.05)
+
+    last_seen_recorder.flush(app)
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--follows", type=int, default=20, help="mean follows per user")
+    parser.add_argument("--alpha", type=float, default=2.0, help="Pareto shape")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database", help="database URI, defaults to a temp file")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument(
+        "--startup", action="store_true", help="time cold and warm process starts"
+    )
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        report = startup(users=args.users, posts=args.posts, random_seed=args.seed)
+        columns = list(next(iter(report["startup"].values())))
+        print(f"{'mode':<10}" + "".join(f"{column[:-3]:>16}" for column in columns))
+        for mode, result in report["startup"].items():
+            values = "".join(f"{result[column]:>16.1f}" for column in columns)
+            print(f"{mode:<10}{values}")
+        _write(report, args.output)
+        return
+
+    report = run(
+        users=args.users,
+        posts=args.posts,
+        follows=args.follows,
+        alpha=args.alpha,
+        clients=args.clients,
+        requests=args.requests,
+        warmup=args.warmup,
+        random_seed=args.seed,
+        database=args.database,
+    )
+
+    header = f"{'scenario':<10}{'p50':>10}{'p95':>10}{'p99':>10}{'queries':>10}{'req/s':>10}"
+    print(header)
+    for scenario, result in report["scenarios"].items():
+        print(
+            f"{scenario:<10}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+            f"{result['p99_ms']:>10.2f}{result['queries_mean']:>10.1f}"
+            f"{result['throughput_rps']:>10.1f}"
+        )
+
+    _write(report, args.output)
+
+
+def _write(report: Dict, path: Optional[str]) -> None:
+    if path:
+        with open(path, "w") as output:
+            json.dump(report, output, indent=2)
+            output.write("\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
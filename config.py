@@ -10,6 +10,29 @@ class Config:
         os.environ.get("DATABASE_URI") or f"sqlite:///{os.path.join(basedir, 'app.db')}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # reads of GET requests to marked views go to the replica if one is set
+    SQLALCHEMY_BINDS = (
+        {"replica": os.environ["DATABASE_REPLICA_URI"]}
+        if os.environ.get("DATABASE_REPLICA_URI")
+        else None
+    )
+    # clients read from the primary for this long after writing
+    DATABASE_REPLICA_LAG = 5
+
+    # run on every new SQLite connection; auto_vacuum only takes effect on
+    # new databases or after `flask db-maint --full-vacuum`
+    SQLITE_PRAGMAS = {
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT") or 5000),
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,
+    }
+    # pooled connections per process to a SQLite file, 0 opens one per use
+    SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE") or 5)
+    SQLITE_POOL_MAX_OVERFLOW = 10
+    SQLITE_POOL_TIMEOUT = 30
 
     MAIL_SERVER = os.environ.get("MAIL_SERVER")
     MAIL_PORT = int(os.environ.get("MAIL_PORT") or 25)
@@ -18,9 +41,105 @@ class Config:
     MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD")
     ADMINS = ["admin@example.com"]
 
+    # 0 workers delivers mail from the outbox synchronously
+    MAIL_OUTBOX_WORKERS = int(os.environ.get("MAIL_OUTBOX_WORKERS") or 2)
+    MAIL_OUTBOX_BATCH_SIZE = 20
+    MAIL_OUTBOX_MAX_ATTEMPTS = 5
+    MAIL_OUTBOX_BACKOFF = 30
+    MAIL_OUTBOX_LEASE = 300
+    MAIL_OUTBOX_POLL_INTERVAL = 30
+
+    LOG_FILE_MAX_BYTES = int(os.environ.get("LOG_FILE_MAX_BYTES") or 50 * 1024 * 1024)
+    LOG_FILE_BACKUP_COUNT = int(os.environ.get("LOG_FILE_BACKUP_COUNT") or 10)
+    LOG_FILE_BUFFER_RECORDS = 200
+    LOG_FILE_FLUSH_INTERVAL = 5
+    # the same error is emailed at most once per window
+    LOG_MAIL_DEDUP_WINDOW = 600
+    LOG_MAIL_MAX_PER_HOUR = 20
+
+    # hashes made with other parameters are upgraded on the next login
+    PASSWORD_HASH_METHOD = (
+        os.environ.get("PASSWORD_HASH_METHOD") or "pbkdf2:sha256:260000"
+    )
+    # 0 workers hashes passwords in the request thread
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS") or 2)
+    PASSWORD_HASH_MAX_PENDING = 32
+
     POSTS_PER_PAGE = 25
 
+    # `flask serve` runs twice as many workers as CPU cores plus one, unless
+    # set, and replaces each worker after its max requests plus some jitter,
+    # never if max requests is 0
+    SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS") or 0)
+    SERVER_MAX_REQUESTS = int(os.environ.get("SERVER_MAX_REQUESTS") or 1000)
+    SERVER_MAX_REQUESTS_JITTER = 100
+    SERVER_GRACEFUL_TIMEOUT = 30
+
+    # load lazily initialized data in create_app, before workers are forked
+    WARMUP = os.environ.get("WARMUP") is not None
+    # compiled templates are kept here across restarts, unless empty
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get(
+        "JINJA_BYTECODE_CACHE_DIR", os.path.join(basedir, "cache", "jinja")
+    )
+
+    # add Server-Timing headers and profile logs to a share of requests
+    PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED") is not None
+    PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE") or 1.0)
+
+    # serve identicons from this app instead of Gravatar
+    AVATARS_LOCAL = os.environ.get("AVATARS_LOCAL") is not None
+    AVATAR_SIZES = [70, 256]
+    AVATAR_CACHE_DIR = os.environ.get("AVATAR_CACHE_DIR") or os.path.join(
+        basedir, "cache", "avatars"
+    )
+    AVATAR_MAX_AGE = 365 * 24 * 60 * 60
+
+    TIMELINE_FANOUT_LIMIT = 10000
+    TIMELINE_BACKFILL_LIMIT = 200
+
+    # changes made by other processes show up once entries expire
+    FOLLOW_GRAPH_CACHE_SIZE = 10000
+    FOLLOW_GRAPH_CACHE_TTL = 10
+
+    # snapshots of logged in users, saving a query at the start of requests
+    IDENTITY_CACHE_TTL = 30
+    IDENTITY_CACHE_SIZE = 10000
+
+    # `last_seen` is written behind in bulk unless exact mode is on
+    LAST_SEEN_EXACT = os.environ.get("LAST_SEEN_EXACT") is not None
+    LAST_SEEN_THROTTLE = 60
+    LAST_SEEN_FLUSH_INTERVAL = 10
+
+    # `fts5` or `inverted`, by default FTS5 is used on SQLite only
+    SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND")
+    # search score added for every day a post is newer than another
+    SEARCH_RECENCY_WEIGHT = 0.1
+
+    FRAGMENT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+    # the first pages of the explore feed are shared by all users for a while
+    EXPLORE_CACHE_PAGES = 5
+    EXPLORE_CACHE_TTL = 10
+
     LANGUAGES = ["en", "ru"]
 
+    # post languages are detected by background workers unless sync is on
+    LANGUAGE_DETECTION_SYNC = os.environ.get("LANGUAGE_DETECTION_SYNC") is not None
+    LANGUAGE_DETECTION_WORKERS = 2
+    LANGUAGE_DETECTION_BATCH_SIZE = 50
+    # idle workers look for posts whose queued detection was lost this often
+    LANGUAGE_DETECTION_POLL_INTERVAL = 30
+    # posts shorter than this take their author's dominant language, if at
+    # least this share of the author's posts is written in it
+    LANGUAGE_DETECTION_SHORT_POST = 20
+    LANGUAGE_DETECTION_HISTORY_SHARE = 0.8
+
     YANDEX_TRANSLATE_TOKEN = os.environ.get("YANDEX_TRANSLATE_TOKEN")
     YANDEX_TRANSLATE_FOLDER_ID = os.environ.get("YANDEX_TRANSLATE_FOLDER_ID")
+    YANDEX_TRANSLATE_URL = (
+        os.environ.get("YANDEX_TRANSLATE_URL")
+        or "https://translate.api.cloud.yandex.net/translate/v2/translate"
+    )
+    TRANSLATE_TIMEOUT = 10
+    TRANSLATE_BATCH_SIZE = 50
+    TRANSLATION_CACHE_SIZE = 10000
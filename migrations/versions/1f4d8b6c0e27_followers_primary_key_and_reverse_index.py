@@ -0,0 +1,46 @@
+"""followers primary key and reverse index
+
+Revision ID: 1f4d8b6c0e27
+Revises: e5b94d07a1c8
+Create Date: 2026-10-18 14:05:52.530186
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f4d8b6c0e27'
+down_revision = 'e5b94d07a1c8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # drop incomplete and duplicate edges, the primary key would reject them
+    op.execute('DELETE FROM followers WHERE follower_id IS NULL OR followed_id IS NULL')
+    op.execute(
+        'DELETE FROM followers WHERE rowid NOT IN '
+        '(SELECT min(rowid) FROM followers GROUP BY follower_id, followed_id)'
+    )
+
+    with op.batch_alter_table('followers', recreate='always') as batch_op:
+        batch_op.alter_column('follower_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('followed_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_primary_key('pk_followers', ['follower_id', 'followed_id'])
+    op.create_index('ix_followers_followed_id', 'followers', ['followed_id', 'follower_id'], unique=False)
+
+    # counters may have included duplicate edges
+    op.execute(
+        'UPDATE "user" SET '
+        'followers_count = (SELECT count(*) FROM followers WHERE followers.followed_id = "user".id), '
+        'followed_count = (SELECT count(*) FROM followers WHERE followers.follower_id = "user".id)'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_followers_followed_id', table_name='followers')
+    with op.batch_alter_table('followers', recreate='always') as batch_op:
+        batch_op.drop_constraint('pk_followers', type_='primary')
+        batch_op.alter_column('followed_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('follower_id', existing_type=sa.Integer(), nullable=True)
@@ -0,0 +1,37 @@
+"""add email_hash to user table
+
+Revision ID: 8a5f3e1b7c02
+Revises: 6d2a9c4e8f13
+Create Date: 2026-10-18 18:12:09.957312
+
+"""
+from hashlib import md5
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a5f3e1b7c02'
+down_revision = '6d2a9c4e8f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('email_hash', sa.String(length=32), nullable=True))
+
+    # md5 is not available in SQLite, so digests are computed here
+    user = sa.table('user', sa.column('id'), sa.column('email'), sa.column('email_hash'))
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(user.c.id, user.c.email).where(user.c.email.isnot(None))).fetchall()
+    if rows:
+        connection.execute(
+            user.update().where(user.c.id == sa.bindparam('user_id')).values(email_hash=sa.bindparam('digest')),
+            [{'user_id': id, 'digest': md5(email.lower().encode()).hexdigest()} for id, email in rows],
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('email_hash')
@@ -0,0 +1,48 @@
+"""home timeline table
+
+Revision ID: a3c1f0d9b2e4
+Revises: 5ec9b8e33a21
+Create Date: 2026-10-18 10:02:11.402913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c1f0d9b2e4'
+down_revision = '5ec9b8e33a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('timeline',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+    op.create_index('ix_timeline_user_id_timestamp', 'timeline', ['user_id', 'timestamp', 'post_id'], unique=False)
+    op.add_column('user', sa.Column('timeline_pull', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+    # populate timelines from existing posts and follow edges
+    op.execute(
+        'INSERT INTO timeline (user_id, post_id, timestamp) '
+        'SELECT user_id, id, timestamp FROM post WHERE user_id IS NOT NULL'
+    )
+    op.execute(
+        'INSERT INTO timeline (user_id, post_id, timestamp) '
+        'SELECT DISTINCT followers.follower_id, post.id, post.timestamp '
+        'FROM followers JOIN post ON post.user_id = followers.followed_id '
+        'WHERE followers.follower_id != followers.followed_id'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('timeline_pull')
+    op.drop_index('ix_timeline_user_id_timestamp', table_name='timeline')
+    op.drop_table('timeline')
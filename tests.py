@@ -1,24 +1,96 @@
 from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+from queue import Empty, Queue
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from threading import BoundedSemaphore, Event, Thread
 import unittest
+from unittest import mock
+from urllib.request import urlopen
+
+from flask import session as cookie_session
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
 
 from app import (
-    app,
+    create_app,
     db,
+    explore_cache,
+    follow_graph,
+    fragment_cache,
+    identity_cache,
+    language_detector,
+    last_seen_recorder,
+    mail,
+    outbox,
+    password_hasher,
+    search_index,
+)
+from app.cache import LRUCache, TTLCache
+from app.database import checkpoint, vacuum
+from app.data import (
+    deferred_indexes,
+    export_records,
+    import_records,
+    read_records,
+    rebuild_derived_data,
 )
+from app.log import (
+    FlushingQueueListener,
+    JSONFormatter,
+    MailRateLimitFilter,
+    TimedMemoryHandler,
+)
+from app.pagination import cursor_args, decode_cursor, encode_cursor, paginate
+from app.server import PreforkServer
+from app.translate import pretranslate, translate
 from app.models import (
+    OutboxMessage,
     Post,
     User,
+    followers,
+    load_user,
+    timeline,
 )
+import benchmark
+from config import Config
+
 
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    WTF_CSRF_ENABLED = False
+    LAST_SEEN_EXACT = True
+    LANGUAGE_DETECTION_SYNC = True
+    MAIL_OUTBOX_WORKERS = 0
+    EXPLORE_CACHE_PAGES = 0
+    PASSWORD_HASH_WORKERS = 0
+
+
+class AppTestCase(unittest.TestCase):
+    config = TestConfig
 
-class UserModelTestCase(unittest.TestCase):
     def setUp(self) -> None:
-        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.app = create_app(self.config)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
         db.create_all()
 
     def tearDown(self) -> None:
         db.session.remove()
         db.drop_all()
+        self.app_context.pop()
+
+
+class UserModelTestCase(AppTestCase):
 
     def test_password_hashing(self) -> None:
         # Arrange
@@ -44,6 +116,41 @@ class UserModelTestCase(unittest.TestCase):
             "https://www.gravatar.com/avatar/f3fc30174d7fd74ab6ca3c36d198fcb9?d=identicon&s=128"
         )
 
+    def test_local_avatar(self) -> None:
+        # Arrange
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.app.config["AVATARS_LOCAL"] = True
+        self.app.config["AVATAR_CACHE_DIR"] = directory.name
+        user = User(username="susan", email="Susan@example.com")
+        db.session.add(user)
+        db.session.commit()
+        digest = "f3fc30174d7fd74ab6ca3c36d198fcb9"
+        stranger = "0123456789abcdef0123456789abcdef"
+
+        # Act
+        with self.app.test_request_context():
+            url = user.avatar(70)
+        response = self.app.test_client().get(url)
+        missing = self.app.test_client().get(f"/avatar/{digest}/71")
+        unknown = self.app.test_client().get(f"/avatar/{stranger}/70")
+
+        # Assert
+        self.assertEqual(url, f"/avatar/{digest}/70")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "image/svg+xml")
+        self.assertIn("immutable", response.headers["Cache-Control"])
+        self.assertTrue(response.data.startswith(b"<svg"))
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.app.config["AVATAR_CACHE_DIR"], "f3", f"{digest}-70.svg")
+            )
+        )
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(unknown.status_code, 404)
+        self.assertEqual(os.listdir(directory.name), ["f3"])
+        response.close()
+
     def test_follow(self) -> None:
         # Arrange
         u1 = User(username="susan", email="susan@example.com")
@@ -119,6 +226,1461 @@ class UserModelTestCase(unittest.TestCase):
         self.assertEqual(followed[2], [posts[3], posts[2]])
         self.assertEqual(followed[3], [posts[3]])
 
+    def test_follow_graph_cache(self) -> None:
+        # Arrange
+        u1 = User(username="susan", email="susan@example.com")
+        u2 = User(username="john", email="john@example.com")
+        db.session.add_all([u1, u2])
+        db.session.commit()
+
+        u1.follow(u2)
+        db.session.commit()
+        self.assertTrue(u1.is_following(u2))
+
+        statements = []
+        event.listen(
+            db.engine, "before_cursor_execute", lambda *args: statements.append(args)
+        )
+
+        # Act 1: ids are loaded while warming the cache
+        warm = u1.is_following(u2), u2.is_following(u1)
+
+        # Assert 1
+        self.assertEqual(warm, (True, False))
+        self.assertEqual(len(statements), 1)
+
+        # Act 2: a warm cache answers without SQL
+        self.assertTrue(u1.is_following(u2))
+        self.assertEqual(len(statements), 1)
+
+        # Act 3: unfollow invalidates
+        u1.unfollow(u2)
+        db.session.commit()
+
+        # Assert 3
+        self.assertFalse(u1.is_following(u2))
+        self.assertEqual(follow_graph.followed_ids(u1.id), frozenset())
+
+    def test_follow_graph_changed_by_another_process(self) -> None:
+        # Arrange: the cache says nobody is followed
+        u1, u2, u3 = (
+            User(username=name, email=f"{name}@example.com")
+            for name in ("susan", "john", "david")
+        )
+        db.session.add_all([u1, u2, u3])
+        db.session.commit()
+        self.assertEqual(follow_graph.followed_ids(u1.id), frozenset())
+
+        # another worker adds both edges
+        db.session.execute(
+            followers.insert(),
+            [
+                {"follower_id": u1.id, "followed_id": u2.id},
+                {"follower_id": u1.id, "followed_id": u3.id},
+            ],
+        )
+        db.session.commit()
+
+        # Act 1: writes go by the database, not by the stale cache
+        u1.follow(u2)
+        u1.unfollow(u3)
+        db.session.commit()
+
+        # Assert 1
+        self.assertEqual([user.username for user in u1.followed], ["john"])
+
+        # Act 2: cached reads expire
+        self.assertTrue(u1.is_following(u2))
+        db.session.execute(followers.delete())
+        db.session.commit()
+        stale = u1.is_following(u2)
+        with mock.patch("app.cache.time.monotonic", return_value=time.monotonic() + 60):
+            fresh = u1.is_following(u2)
+
+        # Assert 2
+        self.assertEqual((stale, fresh), (True, False))
+
+    def test_lru_cache_eviction(self) -> None:
+        # Arrange
+        cache = LRUCache(capacity=4, weigh=len)
+
+        # Act
+        cache.set("a", "xx")
+        cache.set("b", "xx")
+        cache.get("a")
+        cache.set("c", "xx")
+
+        # Assert
+        self.assertEqual(cache.get("a"), "xx")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "xx")
+        self.assertEqual(cache.weight, 4)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_ttl_cache_coalesces_misses(self) -> None:
+        # Arrange
+        cache = TTLCache(ttl=60)
+        started, release = Event(), Event()
+        calls = []
+
+        def compute() -> str:
+            calls.append(None)
+            started.set()
+            release.wait(5)
+            return "page"
+
+        # Act
+        results = []
+        threads = [
+            Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        # Assert
+        self.assertEqual(results, ["page"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get_or_compute("k", lambda: "new"), "page")
+
+    def test_ttl_cache_clear_during_compute(self) -> None:
+        # Arrange
+        cache = TTLCache(ttl=60)
+
+        def compute() -> str:
+            cache.clear()
+            return "stale"
+
+        # Act
+        value = cache.get_or_compute("k", compute)
+
+        # Assert: the stale value is returned but not kept
+        self.assertEqual(value, "stale")
+        self.assertEqual(cache.get_or_compute("k", lambda: "fresh"), "fresh")
+
+    def test_cached_user_loader(self) -> None:
+        # Arrange
+        u1 = User(username="susan", email="susan@example.com")
+        u2 = User(username="john", email="john@example.com")
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        db.session.remove()
+        load_user("1")
+        load_user("2")
+        db.session.remove()
+
+        queries = []
+        event.listen(db.engine, "before_cursor_execute", lambda *a: queries.append(a))
+
+        # Act
+        user = load_user("1")
+
+        # Assert: a hit is built without any query
+        self.assertEqual(queries, [])
+        self.assertEqual(user.username, "susan")
+        self.assertEqual(identity_cache.hits, 1)
+
+        # Act 2: changes through the session and bulk counters both invalidate
+        user.username = "susanna"
+        user.follow(User.query.get(2))
+        db.session.commit()
+        db.session.remove()
+
+        # Assert 2
+        user = load_user("1")
+        self.assertEqual(user.username, "susanna")
+        self.assertEqual(load_user("2").followers_count, 1)
+        self.assertIsNone(load_user("3"))
+
+    def test_user_loader_skips_cache_after_writes(self) -> None:
+        # Arrange: another process changed a row this one holds a snapshot of
+        db.session.add(User(username="susan", email="susan@example.com"))
+        db.session.commit()
+        db.session.remove()
+        load_user("1")
+        db.session.execute(
+            User.__table__.update().values(about_me="changed elsewhere")
+        )
+        db.session.commit()
+        db.session.remove()
+
+        # Act
+        with self.app.test_request_context():
+            stale = load_user("1").about_me
+            db.session.remove()
+            cookie_session["_primary_until"] = time.time() + 30
+            fresh = load_user("1").about_me
+        db.session.remove()
+
+        # Assert
+        self.assertIsNone(stale)
+        self.assertEqual(fresh, "changed elsewhere")
+
+    def test_writes_stamp_the_client_session(self) -> None:
+        # Arrange
+        user = User(username="susan", email="susan@example.com")
+        user.set_password("cat")
+        db.session.add(user)
+        db.session.commit()
+        client = self.app.test_client()
+
+        # Act
+        client.post("/auth/login", data={"username": "susan", "password": "cat"})
+        client.post("/edit_profile", data={"username": "susan", "about_me": "hi"})
+
+        # Assert: the stamp covers the identity cache's TTL
+        with client.session_transaction() as session:
+            remaining = session["_primary_until"] - time.time()
+        self.assertGreater(remaining, self.app.config["IDENTITY_CACHE_TTL"] - 5)
+
+    def test_last_seen_write_behind(self) -> None:
+        # Arrange
+        self.app.config["LAST_SEEN_EXACT"] = False
+        u1 = User(username="susan", email="susan@example.com")
+        u2 = User(username="john", email="john@example.com")
+        db.session.add_all([u1, u2])
+        db.session.commit()
+
+        start = datetime.utcnow() + timedelta(hours=1)
+
+        # Act
+        last_seen_recorder.touch(u1, start)
+        last_seen_recorder.touch(u1, start + timedelta(seconds=5))  # throttled
+        last_seen_recorder.touch(u2, start + timedelta(seconds=5))
+        flushed = last_seen_recorder.flush()
+        db.session.expire_all()
+
+        # Assert
+        self.assertEqual(flushed, 2)
+        self.assertEqual(u1.last_seen, start)
+        self.assertEqual(u2.last_seen, start + timedelta(seconds=5))
+        self.assertEqual(last_seen_recorder.flush(), 0)
+
+    def test_last_seen_buffers_are_per_app(self) -> None:
+        # Arrange
+        self.app.config["LAST_SEEN_EXACT"] = False
+        user = User(username="susan", email="susan@example.com")
+        db.session.add(user)
+        db.session.commit()
+        last_seen = user.last_seen
+
+        other = create_app(TestConfig)
+        other.config["LAST_SEEN_EXACT"] = False
+        db.create_all(app=other)
+        users = User.__table__
+        with db.get_engine(other).begin() as connection:
+            connection.execute(users.insert().values(id=user.id, username="john"))
+        when = datetime.utcnow() + timedelta(hours=1)
+
+        # Act
+        last_seen_recorder.touch(user, when - timedelta(hours=2))
+        with other.app_context():
+            last_seen_recorder.touch(user, when)
+        flushed = last_seen_recorder.flush(other)
+        with db.get_engine(other).connect() as connection:
+            john = connection.execute(users.select()).one()
+        db.session.expire_all()
+
+        # Assert
+        self.assertEqual(flushed, 1)
+        self.assertEqual(john.last_seen, when)
+        self.assertEqual(user.last_seen, last_seen)
+        self.assertEqual(last_seen_recorder.flush(), 1)
+
+    def test_language_detection(self) -> None:
+        # Arrange
+        user = User(username="susan", email="susan@example.com")
+        posts = [
+            Post(body="The quick brown fox jumps over the lazy dog", author=user),
+            Post(body="It was the best of times, it was the worst of times", author=user),
+            Post(body="ok", author=user),
+            Post(body="ok", author=User(username="john", email="john@example.com")),
+        ]
+        db.session.add_all([user] + posts)
+        db.session.commit()
+
+        # Act
+        counts = list(language_detector.detect_pending(batch_size=2))
+        db.session.expire_all()
+
+        # Assert
+        self.assertEqual(counts, [2, 2])
+        self.assertEqual([post.language for post in posts[:3]], ["en", "en", "en"])
+        self.assertIsNotNone(posts[3].language)
+
+    def test_idle_language_workers_pick_up_pending_posts(self) -> None:
+        # Arrange: a post whose queued detection was lost with its process
+        post = Post(
+            body="The quick brown fox jumps over the lazy dog",
+            author=User(username="susan", email="susan@example.com"),
+        )
+        db.session.add(post)
+        db.session.commit()
+        workers = self.app.extensions["language_detection_queue"]
+
+        class Stop(BaseException):
+            pass
+
+        # Act: the queue stays empty for a poll interval
+        with mock.patch.object(workers.queue, "get", side_effect=[Empty(), Stop()]):
+            with self.assertRaises(Stop):
+                language_detector._run(workers)
+        db.session.expire_all()
+
+        # Assert
+        self.assertEqual(post.language, "en")
+
+    def test_counters(self) -> None:
+        # Arrange
+        u1 = User(username="susan", email="susan@example.com")
+        u2 = User(username="john", email="john@example.com")
+        db.session.add_all([u1, u2])
+        db.session.commit()
+
+        # Act 1: u1 follows u2, u2 posts twice
+        u1.follow(u2)
+        db.session.add_all([Post(body="one", author=u2), Post(body="two", author=u2)])
+        db.session.commit()
+
+        # Assert 1
+        self.assertEqual((u1.followed_count, u1.followers_count), (1, 0))
+        self.assertEqual((u2.followed_count, u2.followers_count), (0, 1))
+        self.assertEqual((u1.posts_count, u2.posts_count), (0, 2))
+
+        # Act 2: u1 unfollows u2, counters are rebuilt from scratch
+        u1.unfollow(u2)
+        db.session.commit()
+        User.rebuild_counters()
+        db.session.commit()
+
+        # Assert 2
+        self.assertEqual((u1.followed_count, u2.followers_count), (0, 0))
+        self.assertEqual(u2.posts_count, 2)
+
+    def test_timeline_fan_out(self) -> None:
+        # Arrange
+        john = User(username="john", email="john@example.com")
+        susan = User(username="susan", email="susan@example.com")
+        old = Post(body="before follow", author=susan)
+
+        db.session.add_all([john, susan, old])
+        db.session.commit()
+
+        # Act 1: john follows susan, susan posts again
+        john.follow(susan)
+        db.session.commit()
+
+        new = Post(
+            body="after follow",
+            author=susan,
+            timestamp=datetime.utcnow() + timedelta(seconds=1),
+        )
+        db.session.add(new)
+        db.session.commit()
+
+        # Assert 1: old post is backfilled, new post is fanned out
+        self.assertEqual(john.followed_posts().all(), [new, old])
+
+        # Act 2: john unfollows susan
+        john.unfollow(susan)
+        db.session.commit()
+
+        # Assert 2
+        self.assertEqual(john.followed_posts().all(), [])
+        self.assertEqual(susan.followed_posts().all(), [new, old])
+
+    def test_timeline_pull_path(self) -> None:
+        # Arrange
+        self.app.config["TIMELINE_FANOUT_LIMIT"] = 1
+        users = [
+            User(username="john", email="john@example.com"),
+            User(username="susan", email="susan@example.com"),
+            User(username="mary", email="mary@example.com"),
+        ]
+        db.session.add_all(users)
+        db.session.commit()
+
+        users[1].follow(users[0])  # susan follows john
+        users[2].follow(users[0])  # mary follows john
+        db.session.commit()
+
+        # Act
+        post = Post(body="hello", author=users[0])
+        db.session.add(post)
+        db.session.commit()
+
+        # Assert
+        self.assertTrue(users[0].timeline_pull)
+        self.assertEqual(users[0].followed_posts().all(), [post])
+        self.assertEqual(users[1].followed_posts().all(), [post])
+        self.assertEqual(users[2].followed_posts().all(), [post])
+
+        # Act 2: followers of an author on the pull path are not read
+        statements = []
+        event.listen(
+            db.engine,
+            "before_cursor_execute",
+            lambda conn, cursor, statement, *args: statements.append(statement),
+        )
+        db.session.add(Post(body="again", author=users[0]))
+        db.session.commit()
+
+        # Assert 2
+        self.assertFalse(any("FROM followers" in sql for sql in statements))
+
+    def test_rebuild_timelines(self) -> None:
+        # Arrange
+        john = User(username="john", email="john@example.com")
+        susan = User(username="susan", email="susan@example.com")
+        post = Post(body="hello", author=susan)
+        db.session.add_all([john, susan, post])
+        db.session.commit()
+
+        john.follow(susan)
+        db.session.commit()
+        db.session.execute(timeline.delete())
+
+        # Act
+        User.rebuild_timelines()
+        db.session.commit()
+
+        # Assert
+        self.assertEqual(john.followed_posts().all(), [post])
+        self.assertEqual(susan.followed_posts().all(), [post])
+
+
+class PaginationTestCase(AppTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        user = User(username="susan", email="susan@example.com")
+        now = datetime.utcnow()
+        # two posts share a timestamp to exercise the id tie-breaker
+        self.posts = [
+            Post(body=f"post {i}", author=user, timestamp=now + timedelta(seconds=i // 2))
+            for i in range(7)
+        ]
+        db.session.add_all([user] + self.posts)
+        db.session.commit()
+
+        self.newest_first = sorted(
+            self.posts, key=lambda post: (post.timestamp, post.id), reverse=True
+        )
+
+    def test_keyset_forward_and_backward(self) -> None:
+        # Arrange
+        key = (Post.timestamp, Post.id)
+
+        # Act
+        first = paginate(Post.query, key, 3)
+        second = paginate(Post.query, key, 3, after=decode_cursor(first.next_cursor))
+        third = paginate(Post.query, key, 3, after=decode_cursor(second.next_cursor))
+        back = paginate(Post.query, key, 3, before=decode_cursor(second.prev_cursor))
+
+        # Assert
+        self.assertEqual(first.items, self.newest_first[0:3])
+        self.assertFalse(first.has_prev)
+        self.assertEqual(second.items, self.newest_first[3:6])
+        self.assertEqual(third.items, self.newest_first[6:])
+        self.assertFalse(third.has_next)
+        self.assertEqual(back.items, first.items)
+        self.assertFalse(back.has_prev)
+
+    def test_malformed_cursors(self) -> None:
+        # Arrange
+        cursors = [
+            encode_cursor(({}, 1)),
+            encode_cursor(("yesterday", 1)),
+            encode_cursor((datetime.utcnow(), "1")),
+            encode_cursor((1.5, True)),
+            encode_cursor((datetime.utcnow(), 10**30)),
+            encode_cursor((10**30, 1)),
+            "not base64!",
+        ]
+
+        # Act / Assert
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ValueError):
+                    decode_cursor(cursor)
+        self.assertEqual(decode_cursor(encode_cursor((1.5, 2))), (1.5, 2))
+
+        with self.app.test_request_context(f"/explore?page={10**23}"):
+            page = paginate(Post.query, (Post.timestamp, Post.id), 3, **cursor_args())
+        self.assertEqual(page.items, [])
+
+    def test_legacy_page_number(self) -> None:
+        # Act
+        page = paginate(Post.query, (Post.timestamp, Post.id), 3, page=2)
+
+        # Assert
+        self.assertEqual(page.items, self.newest_first[3:6])
+        self.assertTrue(page.has_prev)
+        self.assertTrue(page.has_next)
+
+
+class FeedQueriesTestCase(AppTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        reader = User(username="reader", email="reader@example.com")
+        reader.set_password("cat")
+        authors = [User(username=f"author{i}", email=f"a{i}@example.com") for i in range(25)]
+        authors[0].set_password("cat")
+        posts = [Post(body=f"post {i}", author=author) for i, author in enumerate(authors)]
+        db.session.add_all([reader] + authors + posts)
+        db.session.commit()
+
+        for author in authors:
+            reader.follow(author)
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.client.post("/auth/login", data={"username": "reader", "password": "cat"})
+
+    def count_queries(self, url: str) -> int:
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+        self.assertEqual(response.status_code, 200)
+        return len(statements)
+
+    def test_feed_queries_are_bounded(self) -> None:
+        for url in ("/index", "/explore", "/user/author0"):
+            with self.subTest(url=url):
+                self.assertLessEqual(self.count_queries(url), 8)
+
+    def test_post_fragments_are_cached(self) -> None:
+        # Act 1: the second render is served from the cache
+        first = self.client.get("/explore").data
+        misses = fragment_cache.misses
+        second = self.client.get("/explore").data
+
+        # Assert 1
+        self.assertEqual(first, second)
+        self.assertEqual(misses, 25)
+        self.assertEqual(fragment_cache.misses, 25)
+        self.assertEqual(fragment_cache.hits, 25)
+
+        # Act 2: renaming an author invalidates their fragments only
+        self.client.get("/auth/logout")
+        self.client.post("/auth/login", data={"username": "author0", "password": "cat"})
+        self.client.post("/edit_profile", data={"username": "renamed", "about_me": ""})
+        page = self.client.get("/explore").data
+
+        # Assert 2
+        self.assertIn(b"renamed", page)
+        self.assertEqual(fragment_cache.misses, 26)
+
+    def test_explore_pages_are_shared(self) -> None:
+        # Arrange
+        explore_cache.pages = 2
+        self.app.config["POSTS_PER_PAGE"] = 10
+        first = self.count_queries("/explore")
+
+        # Act 1: cached pages are served without post queries
+        cached = self.count_queries("/explore")
+        page_2 = self.client.get("/explore").data.decode()
+        second_url = re.search(r'href="(/explore\?after=[^"]+)"', page_2).group(1)
+        self.client.get(second_url)
+        self.client.get(second_url)
+
+        # Assert 1
+        self.assertLess(cached, first)
+        self.assertEqual((explore_cache.misses, explore_cache.hits), (2, 3))
+
+        # Act 2: a new post drops the cached pages
+        self.client.post("/index", data={"post": "brand new"})
+
+        # Assert 2
+        self.assertIn(b"brand new", self.client.get("/explore").data)
+
+
+class ProfilingConfig(TestConfig):
+    PROFILING_ENABLED = True
+
+
+class ProfilingTestCase(AppTestCase):
+    config = ProfilingConfig
+
+    def setUp(self) -> None:
+        super().setUp()
+
+        user = User(username="susan", email="susan@example.com")
+        user.set_password("cat")
+        db.session.add_all([user, Post(body="hello", author=user)])
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.client.post("/auth/login", data={"username": "susan", "password": "cat"})
+
+    def test_server_timing_header(self) -> None:
+        # Act
+        response = self.client.get("/explore")
+
+        # Assert
+        timings = response.headers["Server-Timing"].split(", ")
+        names = [timing.split(";")[0] for timing in timings]
+        self.assertEqual(names, ["sql", "render", "before", "total"])
+        self.assertNotIn('desc="0 queries"', timings[0])
+
+    def test_sample_rate(self) -> None:
+        # Arrange
+        self.app.config["PROFILING_SAMPLE_RATE"] = 0
+
+        # Act
+        response = self.client.get("/explore")
+
+        # Assert
+        self.assertNotIn("Server-Timing", response.headers)
+
+
+class ApiTestCase(AppTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        user = User(username="susan", email="susan@example.com")
+        user.set_password("cat")
+        db.session.add_all([user, Post(body="hello", author=user)])
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.client.post("/auth/login", data={"username": "susan", "password": "cat"})
+
+    def test_malformed_cursor(self) -> None:
+        # Arrange
+        cursor = encode_cursor(({}, 1))
+
+        # Act
+        api = self.client.get(f"/api/feed/explore?after={cursor}")
+        page = self.client.get(f"/explore?before={cursor}")
+
+        # Assert
+        self.assertEqual(api.status_code, 400)
+        self.assertEqual(api.json, {"error": "Malformed after cursor."})
+        self.assertEqual(page.status_code, 400)
+
+    def test_feed_etag(self) -> None:
+        # Act 1
+        first = self.client.get("/api/feed/explore")
+        cached = self.client.get(
+            "/api/feed/explore", headers={"If-None-Match": first.headers["ETag"]}
+        )
+
+        # Assert 1
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json["posts"][0]["body"], "hello")
+        self.assertEqual(first.json["authors"]["1"]["username"], "susan")
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.headers["ETag"], first.headers["ETag"])
+
+        # Act 2: a new post changes the tag
+        etag = self.client.get("/api/feed/home").headers["ETag"]
+        self.client.post("/index", data={"post": "again"})
+        changed = self.client.get("/api/feed/home", headers={"If-None-Match": etag})
+
+        # Assert 2
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(
+            [post["body"] for post in changed.json["posts"]], ["again", "hello"]
+        )
+
+    def test_feed_etag_tracks_follows_languages_and_authors(self) -> None:
+        # Arrange
+        john = User(username="john", email="john@example.com")
+        post = Post(body="from john", author=john)
+        db.session.add_all([john, post])
+        db.session.commit()
+
+        def etag(url: str) -> str:
+            return self.client.get(url).headers["ETag"]
+
+        home, explore = etag("/api/feed/home"), etag("/api/feed/explore")
+
+        # Act 1: following backfills an older post into the home feed
+        self.client.post("/follow/john")
+
+        # Assert 1
+        self.assertNotEqual(etag("/api/feed/home"), home)
+
+        # Act 2: the language of a post is detected
+        post.language = "en"
+        db.session.commit()
+        detected = etag("/api/feed/explore")
+
+        # Assert 2
+        self.assertNotEqual(detected, explore)
+
+        # Act 3: the author renames themselves
+        john.username = "johnny"
+        john.profile_version = User.profile_version + 1
+        db.session.commit()
+
+        # Assert 3
+        self.assertNotEqual(etag("/api/feed/explore"), detected)
+
+    def test_profile_avatar_is_served(self) -> None:
+        # Arrange
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.app.config["AVATARS_LOCAL"] = True
+        self.app.config["AVATAR_CACHE_DIR"] = directory.name
+
+        # Act
+        avatar = self.client.get("/api/users/susan").json["avatar"]
+        response = self.client.get(avatar)
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_profile_etag(self) -> None:
+        # Arrange
+        john = User(username="john", email="john@example.com")
+        db.session.add(john)
+        db.session.commit()
+
+        # Act
+        first = self.client.get("/api/users/john")
+        cached = self.client.get(
+            "/api/users/john", headers={"If-None-Match": first.headers["ETag"]}
+        )
+        john.about_me = "hi"
+        db.session.commit()
+        changed = self.client.get(
+            "/api/users/john", headers={"If-None-Match": first.headers["ETag"]}
+        )
+
+        # Assert
+        self.assertEqual(first.json["posts"], 0)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(changed.json["about_me"], "hi")
+
+    def test_requires_login(self) -> None:
+        self.client.get("/auth/logout")
+        self.assertEqual(self.client.get("/api/feed/explore").status_code, 401)
+
+
+class PasswordHashingTestCase(AppTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.user = User(username="susan", email="susan@example.com")
+        self.user.password_hash = generate_password_hash(
+            "cat", method="pbkdf2:sha256:1000"
+        )
+        db.session.add(self.user)
+        db.session.commit()
+
+        self.client = self.app.test_client()
+
+    def login(self):
+        return self.client.post(
+            "/auth/login", data={"username": "susan", "password": "cat"}
+        )
+
+    def test_rehash_on_login(self) -> None:
+        # Act
+        response = self.login()
+
+        # Assert
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(self.user.password_hash.startswith("pbkdf2:sha256:260000$"))
+        self.assertFalse(password_hasher.needs_rehash(self.user.password_hash))
+        self.assertTrue(self.user.check_password("cat"))
+
+    def test_needs_rehash_fills_in_defaults(self) -> None:
+        # Arrange
+        self.addCleanup(setattr, password_hasher, "method", password_hasher.method)
+        password_hasher.method = "pbkdf2:sha256"
+        current = generate_password_hash("cat", method="pbkdf2:sha256:260000")
+
+        # Act
+        rehash = [
+            password_hasher.needs_rehash(current),
+            password_hasher.needs_rehash(self.user.password_hash),
+            password_hasher.needs_rehash(generate_password_hash("cat", "sha256")),
+        ]
+
+        # Assert
+        self.assertEqual(rehash, [False, True, True])
+
+    def test_process_pool(self) -> None:
+        # Arrange
+        password_hasher.workers = 1
+        password_hasher._pending = BoundedSemaphore(1)
+        self.addCleanup(setattr, password_hasher, "workers", 0)
+
+        # Act 1
+        password_hash = password_hasher.hash("dog")
+
+        # Assert 1
+        self.assertTrue(password_hasher.verify(password_hash, "dog"))
+        self.assertFalse(password_hasher.verify(password_hash, "cat"))
+
+        # Act 2: no room left for another operation
+        password_hasher._pending.acquire()
+        response = self.login()
+
+        # Assert 2
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+
+class SearchTestCase(AppTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        user = User(username="susan", email="susan@example.com")
+        now = datetime.utcnow()
+        self.posts = [
+            Post(body="cats and dogs", author=user, timestamp=now - timedelta(days=30)),
+            Post(body="dogs dogs dogs", author=user, timestamp=now - timedelta(days=20)),
+            Post(body="just cats", author=user, timestamp=now - timedelta(days=10)),
+            Post(body="a dog", author=user, timestamp=now),
+        ]
+        db.session.add_all([user] + self.posts)
+        db.session.commit()
+
+    def search(self, text: str, **cursor) -> list:
+        query, key = search_index.search(text)
+        return paginate(query, key, 10, **cursor).items
+
+    def test_fts_search(self) -> None:
+        self.assertEqual(search_index.backend(), "fts5")
+        self.assertEqual(self.search("dogs"), [self.posts[1], self.posts[0]])
+        self.assertEqual(self.search("CATS dogs"), [self.posts[0]])
+        self.assertEqual(self.search('"unbalanced'), [])
+        self.assertEqual(self.search("!!"), [])
+
+    def test_inverted_index_search(self) -> None:
+        # Arrange
+        self.app.config["SEARCH_BACKEND"] = "inverted"
+        list(search_index.rebuild(2))
+
+        # Act
+        db.session.add(Post(body="more dogs", user_id=1))
+        db.session.commit()
+
+        # Assert
+        self.assertEqual(
+            [post.body for post in self.search("dogs")],
+            ["more dogs", "dogs dogs dogs", "cats and dogs"],
+        )
+
+    def test_recency_and_pagination(self) -> None:
+        # Arrange: recency outweighs a single extra match
+        self.app.config["SEARCH_RECENCY_WEIGHT"] = 10
+
+        # Act
+        query, key = search_index.search("cats")
+        first = paginate(query, key, 1)
+        second = paginate(query, key, 1, after=decode_cursor(first.next_cursor))
+
+        # Assert
+        self.assertEqual(first.items, [self.posts[2]])
+        self.assertEqual(second.items, [self.posts[0]])
+        self.assertFalse(second.has_next)
+
+
+class OutboxTestCase(AppTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        user = User(username="susan", email="susan@example.com")
+        db.session.add(user)
+        db.session.commit()
+
+    def test_password_reset_goes_through_outbox(self) -> None:
+        # Act
+        with mail.record_messages() as sent:
+            response = self.app.test_client().post(
+                "/auth/reset_password_request", data={"email": "susan@example.com"}
+            )
+
+        # Assert
+        message = OutboxMessage.query.one()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0].recipients, ["susan@example.com"])
+        self.assertIsNotNone(message.sent_at)
+        self.assertIsNone(message.next_attempt_at)
+
+    def test_failed_delivery_is_retried_with_backoff(self) -> None:
+        # Act 1: the SMTP server is down
+        with mock.patch.object(mail, "connect", side_effect=ConnectionRefusedError):
+            outbox.enqueue("Hi", "admin@example.com", ["susan@example.com"], "hi", "hi")
+
+        # Assert 1
+        message = OutboxMessage.query.one()
+        self.assertEqual(message.attempts, 1)
+        self.assertIsNone(message.sent_at)
+        self.assertGreater(message.next_attempt_at, datetime.utcnow())
+        self.assertEqual(outbox.drain(), 0)
+
+        # Act 2: the retry becomes due
+        message.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        with mail.record_messages() as sent:
+            delivered = outbox.drain()
+
+        # Assert 2
+        self.assertEqual((delivered, len(sent)), (1, 1))
+
+
+class LoggingTestCase(unittest.TestCase):
+    def make_record(self, msg: str, lineno: int = 1) -> logging.LogRecord:
+        return logging.LogRecord("app", logging.ERROR, "app.py", lineno, msg, None, None)
+
+    def test_mail_rate_limit(self) -> None:
+        # Arrange
+        limit = MailRateLimitFilter(dedup_window=600, max_per_hour=2)
+
+        # Act
+        passed = [
+            limit.filter(self.make_record("boom")),
+            limit.filter(self.make_record("boom")),  # duplicate
+            limit.filter(self.make_record("bang", lineno=2)),
+            limit.filter(self.make_record("crash", lineno=3)),  # over the limit
+        ]
+
+        # Assert
+        self.assertEqual(passed, [True, False, True, False])
+
+    def test_mail_rate_limit_keys_on_call_site(self) -> None:
+        # Arrange
+        limit = MailRateLimitFilter(dedup_window=600, max_per_hour=100)
+
+        # Act
+        with mock.patch("app.log.time.monotonic", return_value=0):
+            passed = [
+                limit.filter(self.make_record(f"user {id} failed")) for id in range(3)
+            ]
+        with mock.patch("app.log.time.monotonic", return_value=601):
+            passed.append(limit.filter(self.make_record("other", lineno=2)))
+
+        # Assert
+        self.assertEqual(passed, [True, False, False, True])
+        self.assertEqual(list(limit._last_sent), [("app.py", 2)])
+
+    def test_json_formatter(self) -> None:
+        # Act
+        line = JSONFormatter().format(self.make_record("boom"))
+
+        # Assert
+        entry = json.loads(line)
+        self.assertEqual((entry["level"], entry["message"]), ("ERROR", "boom"))
+
+    def test_buffered_records_are_flushed_while_idle(self) -> None:
+        # Arrange
+        written = Event()
+        target = logging.Handler()
+        target.emit = lambda record: written.set()
+        handler = TimedMemoryHandler(100, flush_interval=0.05, target=target)
+        queue = Queue()
+        listener = FlushingQueueListener(queue, handler)
+        listener.start()
+        self.addCleanup(listener.stop)
+
+        # Act
+        record = self.make_record("boom")
+        record.levelno = logging.INFO
+        queue.put(record)
+
+        # Assert
+        self.assertTrue(written.wait(5))
+        self.assertEqual(handler.buffer, [])
+
+
+class DataTestCase(AppTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+        super().tearDown()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def test_import_resumes_from_checkpoint(self) -> None:
+        # Arrange
+        with open(self.path("users.csv"), "w") as target:
+            target.write("id,username,email\n")
+            for i in range(1, 4):
+                target.write(f"{i},user{i},User{i}@example.com\n")
+        with open(self.path("users.checkpoint"), "w") as target:
+            json.dump({"kind": "users", "records": 1}, target)
+        db.session.add(User(id=1, username="user1", email="user1@example.com"))
+        db.session.commit()
+
+        # Act
+        totals = list(
+            import_records(
+                "users",
+                read_records(self.path("users.csv")),
+                batch_size=1,
+                checkpoint=self.path("users.checkpoint"),
+            )
+        )
+
+        # Assert
+        self.assertEqual(totals, [2, 3])
+        self.assertFalse(os.path.exists(self.path("users.checkpoint")))
+        user = User.query.get(3)
+        self.assertEqual(user.username, "user3")
+        self.assertEqual(user.email_hash, User(email="user3@example.com").email_hash)
+
+    def test_import_posts_and_follows(self) -> None:
+        # Arrange
+        db.session.add_all(
+            [
+                User(id=1, username="john", email="john@example.com"),
+                User(id=2, username="susan", email="susan@example.com"),
+            ]
+        )
+        db.session.commit()
+
+        # Act
+        with deferred_indexes(Post.__table__):
+            list(import_records("posts", [{"body": "hi", "user_id": 2}], 100))
+        list(import_records("follows", [{"follower_id": 1, "followed_id": 2}], 100))
+        rebuild_derived_data()
+
+        # Assert
+        john, susan = User.query.get(1), User.query.get(2)
+        self.assertEqual(susan.posts_count, 1)
+        self.assertEqual(susan.followers_count, 1)
+        self.assertEqual([post.body for post in john.followed_posts()], ["hi"])
+
+    def test_incremental_export(self) -> None:
+        # Arrange
+        user = User(username="susan", email="susan@example.com")
+        now = datetime.utcnow()
+        db.session.add_all(
+            [user]
+            + [
+                Post(body=f"post {i}", author=user, timestamp=now + timedelta(seconds=i))
+                for i in range(3)
+            ]
+        )
+        db.session.commit()
+
+        # Act 1
+        exported = list(export_records("posts", self.path("full.csv.gz"), 2))
+        total, watermark = exported[-1]
+
+        # Assert 1
+        self.assertEqual(total, 3)
+        self.assertEqual(
+            [record["body"] for record in read_records(self.path("full.csv.gz"))],
+            ["post 0", "post 1", "post 2"],
+        )
+
+        # Act 2: only posts newer than the watermark are exported
+        db.session.add(
+            Post(body="post 3", author=user, timestamp=now + timedelta(seconds=3))
+        )
+        db.session.commit()
+        list(export_records("posts", self.path("delta.jsonl"), 2, watermark))
+
+        # Assert 2
+        self.assertEqual(
+            [record["body"] for record in read_records(self.path("delta.jsonl"))],
+            ["post 3"],
+        )
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_benchmark_report(self) -> None:
+        # Act
+        report = benchmark.run(users=20, posts=100, clients=2, requests=4, warmup=1)
+
+        # Assert
+        self.assertEqual(set(report["scenarios"]), set(benchmark.SCENARIOS))
+        for result in report["scenarios"].values():
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        # cached pages and users can serve reads without queries, writes cannot
+        self.assertGreater(report["scenarios"]["post"]["queries_mean"], 0)
+
+    def test_startup_report(self) -> None:
+        # Act
+        report = benchmark.startup(users=5, posts=20)
+
+        # Assert
+        self.assertEqual(list(report["startup"]), list(benchmark.STARTUP_MODES))
+        for result in report["startup"].values():
+            self.assertEqual(
+                set(result),
+                {"import_ms", "create_app_ms"}
+                | {f"first_{name}_ms" for name, *_ in benchmark.STARTUP_REQUESTS},
+            )
+
+
+class SQLiteFileTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+        class FileConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{self.directory.name}/app.db"
+
+        self.app = create_app(FileConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def test_connection_profile(self) -> None:
+        # Act
+        with db.engine.connect() as connection:
+            pragmas = {
+                name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+                for name in ("journal_mode", "synchronous", "busy_timeout")
+            }
+
+        # Assert
+        self.assertEqual(
+            pragmas, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000}
+        )
+        self.assertEqual(db.engine.pool.size(), 5)
+
+    def test_maintenance(self) -> None:
+        # Arrange
+        db.session.add_all(
+            [User(username=f"user{i}", email=f"user{i}@example.com") for i in range(500)]
+        )
+        db.session.commit()
+        User.query.delete()
+        db.session.commit()
+        db.session.remove()
+
+        # Act
+        freed = vacuum(db.engine)
+        logged, copied = checkpoint(db.engine)
+
+        # Assert: every free page went back to the file system
+        with db.engine.connect() as connection:
+            free = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+        self.assertGreater(freed, 1)
+        self.assertEqual(free, 0)
+        self.assertEqual(logged, copied)
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+        class ReplicaConfig(TestConfig):
+            SQLALCHEMY_BINDS = {
+                "replica": f"sqlite:///{self.directory.name}/replica.db"
+            }
+            LAST_SEEN_EXACT = False
+            PROFILING_ENABLED = True
+
+        self.app = create_app(ReplicaConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        user = User(username="susan", email="susan@example.com")
+        user.set_password("cat")
+        db.session.add_all([user, Post(body="replicated", author=user)])
+        db.session.commit()
+
+        # the replica lags behind by the posts added from here on
+        replica = db.get_engine(bind="replica")
+        db.Model.metadata.create_all(replica)
+        with db.engine.connect() as source, replica.begin() as target:
+            for table in db.Model.metadata.sorted_tables:
+                rows = source.execute(table.select()).mappings().all()
+                if rows:
+                    target.execute(table.insert(), [dict(row) for row in rows])
+
+        db.session.add(Post(body="lagging", author=user))
+        db.session.commit()
+        db.session.remove()
+
+        self.client = self.app.test_client()
+        self.client.post("/auth/login", data={"username": "susan", "password": "cat"})
+
+    def tearDown(self) -> None:
+        last_seen_recorder.flush()
+        db.session.remove()
+        db.get_engine(bind="replica").dispose()
+        db.drop_all()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def test_reads_of_marked_views_go_to_replica(self) -> None:
+        # Act
+        explore = self.client.get("/explore")
+        edit_profile = self.client.get("/edit_profile")
+
+        # Assert
+        self.assertIn("replica", explore.headers["Server-Timing"])
+        self.assertIn(b"replicated", explore.data)
+        self.assertNotIn(b"lagging", explore.data)
+        self.assertNotIn("replica", edit_profile.headers["Server-Timing"])
+
+    def test_writes_stick_to_primary(self) -> None:
+        # Act
+        posted = self.client.post("/index", data={"post": "brand new"})
+        explore = self.client.get("/explore")
+
+        # Assert: the writer reads its own post after the redirect
+        self.assertIn('db;desc="primary"', posted.headers["Server-Timing"])
+        self.assertIn('db;desc="primary"', explore.headers["Server-Timing"])
+        self.assertIn(b"brand new", explore.data)
+
+    def test_shared_caches_are_filled_from_primary(self) -> None:
+        # Arrange
+        self.addCleanup(setattr, explore_cache, "pages", explore_cache.pages)
+        explore_cache.pages = 1
+        john = User(username="john", email="john@example.com")
+        john.set_password("dog")
+        db.session.add(john)
+        db.session.commit()
+        users = User.__table__
+        replica = db.get_engine(bind="replica")
+        with db.engine.connect() as source, replica.begin() as target:
+            row = source.execute(users.select().where(users.c.id == john.id)).one()
+            target.execute(users.insert(), [dict(row._mapping)])
+        db.session.remove()
+
+        other = self.app.test_client()
+        other.post("/auth/login", data={"username": "john", "password": "dog"})
+
+        # Act: another client fills the cache while the writer is on the primary
+        self.client.post("/index", data={"post": "just posted"})
+        seen_by_other = other.get("/explore")
+        seen_by_writer = self.client.get("/explore")
+
+        # Assert
+        self.assertIn(b"just posted", seen_by_other.data)
+        self.assertIn(b"just posted", seen_by_writer.data)
+        self.assertEqual(explore_cache.hits, 1)
+
+
+class HealthTestCase(AppTestCase):
+    def test_probes(self) -> None:
+        # Act
+        client = self.app.test_client()
+        liveness = client.get("/healthz")
+        readiness = client.get("/readyz")
+
+        # Assert
+        self.assertEqual(liveness.status_code, 200)
+        self.assertEqual(readiness.status_code, 200)
+        self.assertEqual(readiness.json, {"database": "ok", "warmed_up": False})
+
+    def test_database_unavailable(self) -> None:
+        # Arrange
+        uri = self.app.config["SQLALCHEMY_DATABASE_URI"]
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:////nonexistent/app.db"
+
+        # Act
+        try:
+            readiness = self.app.test_client().get("/readyz")
+        finally:
+            self.app.config["SQLALCHEMY_DATABASE_URI"] = uri
+
+        # Assert
+        self.assertEqual(readiness.status_code, 503)
+        self.assertEqual(readiness.json["database"], "unavailable")
+
+
+class PreforkServerTestCase(unittest.TestCase):
+    def test_recycle_reload_and_stop(self) -> None:
+        # Arrange
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "from app import create_app; from app.server import PreforkServer; "
+                "from tests import TestConfig; "
+                f"PreforkServer(create_app(TestConfig), port={port}, workers=2, "
+                "max_requests=2, graceful_timeout=5).run()",
+            ],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        url = f"http://127.0.0.1:{port}/healthz"
+
+        def get() -> int:
+            with urlopen(url, timeout=5) as response:
+                return response.status
+
+        try:
+            for _ in range(50):
+                try:
+                    get()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+
+            # Act: workers are replaced every 2 requests, and the code reloaded
+            statuses = [get() for _ in range(10)]
+            server.send_signal(signal.SIGHUP)
+            statuses += [get() for _ in range(10)]
+            server.send_signal(signal.SIGTERM)
+            code = server.wait(10)
+        finally:
+            server.kill()
+
+        # Assert
+        self.assertEqual(statuses, [200] * 20)
+        self.assertEqual(code, 0)
+
+    def test_max_requests_zero_never_recycles(self) -> None:
+        # Arrange
+        app = create_app(TestConfig)
+        recycling = PreforkServer(app, max_requests=10, max_requests_jitter=5)
+        forever = PreforkServer(app, max_requests=0, max_requests_jitter=5)
+
+        # Act
+        limits = [recycling._request_limit() for _ in range(20)]
+
+        # Assert
+        self.assertTrue(all(10 <= limit <= 15 for limit in limits))
+        self.assertIsNone(forever._request_limit())
+
+    def test_crashing_workers_are_respawned_with_backoff(self) -> None:
+        # Arrange
+        server = PreforkServer(create_app(TestConfig), workers=1)
+        now = time.monotonic()
+
+        # Act: the first worker fails right after it starts
+        with mock.patch("app.server.os.fork", side_effect=[101, 102]) as fork:
+            with mock.patch("app.server.os.waitpid", side_effect=[(101, 256), (0, 0)]):
+                server._spawn_workers()
+                server._reap()
+                server._spawn_workers()
+                held_back = fork.call_count
+
+            with mock.patch("app.server.time.monotonic", return_value=now + 60):
+                server._spawn_workers()
+
+        # Assert
+        self.assertEqual(held_back, 1)
+        self.assertEqual(fork.call_count, 2)
+        self.assertEqual(server._children, {102})
+
+
+class TranslationServiceStub(BaseHTTPRequestHandler):
+    """Local stand-in for the translation endpoint: upper-cases texts."""
+
+    calls = 0
+    reply = None
+
+    def do_POST(self) -> None:
+        TranslationServiceStub.calls += 1
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        payload = TranslationServiceStub.reply or json.dumps(
+            {"translations": [{"text": text.upper()} for text in body["texts"]]}
+        ).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class TranslationTestCase(AppTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), TranslationServiceStub)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        TranslationServiceStub.calls = 0
+        TranslationServiceStub.reply = None
+
+        self.app.config["YANDEX_TRANSLATE_TOKEN"] = "token"
+        self.app.config["YANDEX_TRANSLATE_FOLDER_ID"] = "folder"
+        self.app.config["YANDEX_TRANSLATE_URL"] = (
+            f"http://127.0.0.1:{self.server.server_port}/translate"
+        )
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_translations_are_cached(self) -> None:
+        # Act
+        first = translate("hello", "en", "ru")
+        second = translate("hello", "en", "ru")
+        self.app.extensions["translation_cache"].clear()
+        third = translate("hello", "en", "ru")
+
+        # Assert
+        self.assertEqual((first, second, third), ("HELLO", "HELLO", "HELLO"))
+        self.assertEqual(TranslationServiceStub.calls, 1)
+
+    def test_malformed_replies_are_failures(self) -> None:
+        # Arrange
+        replies = [
+            b"not json",
+            b'{"texts": []}',
+            b'{"translations": [{"text": 1}]}',
+            b'{"translations": [{"text": "ONE"}, {"text": "TWO"}]}',
+        ]
+
+        # Act / Assert
+        for reply in replies:
+            with self.subTest(reply=reply):
+                TranslationServiceStub.reply = reply
+                with self.app.test_request_context():
+                    translated = translate("hello", "en", "ru")
+                self.assertEqual(translated, "Could not translate text")
+
+    def test_pretranslate(self) -> None:
+        # Arrange
+        user = User(username="susan", email="susan@example.com")
+        posts = [
+            Post(body="hello", author=user, language="en"),
+            Post(body="world", author=user, language="en"),
+            Post(body="privet", author=user, language="ru"),
+        ]
+        db.session.add_all([user] + posts)
+        db.session.commit()
+        translate("hello", "en", "ru")
+
+        # Act
+        added = pretranslate(posts, ["en", "ru"])
+
+        # Assert
+        self.assertEqual(added, 2)
+        self.assertEqual(TranslationServiceStub.calls, 3)
+        self.assertEqual(translate("world", "en", "ru"), "WORLD")
+        self.assertEqual(TranslationServiceStub.calls, 3)
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)